@@ -0,0 +1,215 @@
+import os, sys
+os.environ["SDL_VIDEODRIVER"] = "dummy"
+import argparse
+import gc
+import json
+import subprocess
+import time
+import tracemalloc
+import pygame
+import colony
+import main as game
+
+SCENARIOS = [
+    # name, bees, comb radius, ticks, frames
+    ("10", 10, 8, 3000, 100),
+    ("1k", 1000, 24, 600, 30),
+    ("10k", 10000, 64, 120, 10),
+    ("100k", 100000, 160, 20, 3),
+]
+STARTUP = "startup"
+STARTUP_RUNS = 5
+# what each startup metric runs in a fresh interpreter
+STARTUP_COMMANDS = [
+    ("python_ms", ["-c", "pass"]),
+    ("import_ms", ["-c", "import colony"]),
+    ("headless_ms", ["main.py", "--headless", "1"]),
+]
+ALLOC_TICKS = 5
+POLICY_INTERVAL = 30
+
+# metric, True if higher is better
+METRICS = [
+    ("ticks_per_s", True),
+    ("draw_ms", False),
+    ("cell_draw_ms", False),
+    ("get_bee_us", False),
+    ("enable_cells_ms", False),
+    ("peak_mb", False),
+    ("blocks_per_tick", False),
+    ("python_ms", False),
+    ("import_ms", False),
+    ("headless_ms", False),
+]
+# differences smaller than these are noise, whatever the tolerance
+SLACK = {"draw_ms": 0.5, "cell_draw_ms": 0.5, "get_bee_us": 0.2, "enable_cells_ms": 0.5, "peak_mb": 1, "blocks_per_tick": 50,
+         "python_ms": 10, "import_ms": 10, "headless_ms": 10}
+
+
+def run_ticks(hive, ticks):
+    for i in range(ticks):
+        if hive.tick % POLICY_INTERVAL == 0:
+            colony.tend_colony(hive, hive.tick // POLICY_INTERVAL)
+        colony.update()
+
+def time_calls(fn, min_time = 0.2):
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        fn()
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return elapsed / calls
+
+def get_bees():
+    for job in colony.WORKER_JOBS:
+        colony.hive.get_bee(job)
+
+def draw_cells(surface):
+    for cell in colony.hive.cells:
+        game.draw_cell(surface, cell)
+
+def live_blocks_by_site():
+    # the benchmark's own bookkeeping is left out
+    return { stat.traceback: stat.count for stat in tracemalloc.take_snapshot().statistics("lineno")
+             if stat.traceback[0].filename not in (tracemalloc.__file__, __file__) }
+
+def allocation_churn(hive, ticks):
+    # blocks allocated or freed per tick, added up per allocation site, so frees in one place cannot
+    # hide allocations in another and objects rebuilt every tick count however many are live at the end
+    before = live_blocks_by_site()
+    churn = 0
+    for i in range(ticks):
+        run_ticks(hive, 1)
+        after = live_blocks_by_site()
+        churn += sum(abs(after.get(site, 0) - before.get(site, 0)) for site in after.keys() | before.keys())
+        before = after
+    return churn / ticks
+
+def measure_memory(bees, radius, ticks, frames):
+    # replays the whole scenario under tracemalloc, which would skew the timings if it ran alongside them
+    gc.collect()
+    tracemalloc.start()
+    hive = colony.build_colony(bees, radius)
+    surface = pygame.Surface((colony.SCREEN_WIDTH, colony.SCREEN_HEIGHT))
+    run_ticks(hive, ticks)
+    for i in range(frames):
+        run_ticks(hive, 1)
+        hive.sync_positions()
+        game.draw_scene(surface, False)
+    peak = tracemalloc.get_traced_memory()[1]
+    churn = allocation_churn(hive, ALLOC_TICKS)
+    tracemalloc.stop()
+    return peak, churn
+
+def run_scenario(name, bees, radius, ticks, frames):
+    peak, blocks_per_tick = measure_memory(bees, radius, ticks, frames)
+    gc.collect()
+    hive = colony.build_colony(bees, radius)
+    start = time.perf_counter()
+    run_ticks(hive, ticks)
+    ticks_per_s = ticks / (time.perf_counter() - start)
+
+    surface = pygame.Surface((colony.SCREEN_WIDTH, colony.SCREEN_HEIGHT))
+    game.draw_scene(surface, False)
+    start = time.perf_counter()
+    for i in range(frames):
+        run_ticks(hive, 1)
+        hive.sync_positions()
+        game.draw_scene(surface, False)
+    draw_ms = (time.perf_counter() - start) / frames * 1000
+
+    return {
+        "bees": len(hive.bees),
+        "cells": len(hive.cells),
+        "ticks_per_s": ticks_per_s,
+        "draw_ms": draw_ms,
+        "cell_draw_ms": time_calls(lambda: draw_cells(surface)) * 1000,
+        "get_bee_us": time_calls(get_bees) / len(colony.WORKER_JOBS) * 1e6,
+        "enable_cells_ms": time_calls(hive.enable_cells) * 1000,
+        "peak_mb": peak / 2 ** 20,
+        "blocks_per_tick": blocks_per_tick,
+    }
+
+def run_startup():
+    # best of a few runs, since a cold disk cache only slows the first
+    env = dict(os.environ)
+    env.pop("SDL_VIDEODRIVER", None)
+    here = os.path.dirname(os.path.abspath(__file__))
+    result = {}
+    for metric, args in STARTUP_COMMANDS:
+        times = []
+        for i in range(STARTUP_RUNS):
+            start = time.perf_counter()
+            subprocess.run([sys.executable] + args, cwd=here, env=env, check=True, stdout=subprocess.DEVNULL)
+            times.append((time.perf_counter() - start) * 1000)
+        result[metric] = min(times)
+    return result
+
+def compare(name, result, baseline, tolerance):
+    regressions = []
+    for metric, higher_is_better in METRICS:
+        old = baseline.get(metric)
+        new = result.get(metric)
+        if old is None or new is None:
+            continue
+        slack = SLACK.get(metric, 0)
+        if higher_is_better:
+            worse = new < old * (1 - tolerance)
+        else:
+            worse = new > old * (1 + tolerance) + slack
+        if worse:
+            regressions.append("%s %s: %.2f -> %.2f" % (name, metric, old, new))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Bee Game benchmarks")
+    parser.add_argument("scenarios", nargs="*", help="scenarios to run (default: all of %s)" % ", ".join([s[0] for s in SCENARIOS] + [STARTUP]))
+    parser.add_argument("--baseline", default="bench_baseline.json", help="baseline file to compare against")
+    parser.add_argument("--save", action="store_true", help="save these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="fraction a metric may get worse before it counts as a regression")
+    parser.add_argument("--numpy", action="store_true", help="move bees with the NumPy backend")
+    args = parser.parse_args()
+    if args.numpy and not colony.set_backend(True):
+        parser.error("--numpy needs NumPy installed")
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+
+    print("%-6s %7s %7s %10s %9s %9s %9s %9s %8s %8s" % ("", "bees", "cells", "ticks/s", "draw ms", "cells ms", "get_bee", "enable ms", "peak MB", "blocks"))
+    results = {}
+    regressions = []
+    for name, bees, radius, ticks, frames in SCENARIOS:
+        if args.scenarios and name not in args.scenarios:
+            continue
+        result = run_scenario(name, bees, radius, ticks, frames)
+        results[name] = result
+        print("%-6s %7d %7d %10.1f %9.2f %9.2f %8.2fus %9.2f %8.1f %8.1f" % (
+            name, result["bees"], result["cells"], result["ticks_per_s"], result["draw_ms"], result["cell_draw_ms"],
+            result["get_bee_us"], result["enable_cells_ms"], result["peak_mb"], result["blocks_per_tick"]))
+        if name in baselines:
+            regressions += compare(name, result, baselines[name], args.tolerance)
+    if not args.scenarios or STARTUP in args.scenarios:
+        result = run_startup()
+        results[STARTUP] = result
+        print("startup: python %.1f ms, import colony %.1f ms, --headless 1 %.1f ms" % (
+            result["python_ms"], result["import_ms"], result["headless_ms"]))
+        if STARTUP in baselines:
+            regressions += compare(STARTUP, result, baselines[STARTUP], args.tolerance)
+
+    if args.save:
+        baselines.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print("saved baseline to %s" % args.baseline)
+    elif regressions:
+        print("regressions against %s:" % args.baseline)
+        for regression in regressions:
+            print("  " + regression)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
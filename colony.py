@@ -0,0 +1,1646 @@
+import os
+import random
+import math
+from collections import defaultdict, deque, OrderedDict
+import itertools
+import heapq
+import time
+import struct
+import array
+
+# The simulation of the hive, without pygame: the game in main.py draws it, and the benchmarks,
+# tests and Monte Carlo runs drive it directly. Sizes that follow the screen are set by set_screen_size.
+
+FPS = 60
+MEAL_TIME = FPS * 20 + 1
+MAX_TICKS_PER_FRAME = 200
+
+# Cell types. States share the numbering so a cleaned cell can go back to its type.
+EMPTY, UNBUILT, BUILT, NURSERY, BEE_BREAD, HONEY = range(6)
+(BUILD_REQUESTED, BUILDING, READY, NURSERY_WITH_EGG, NURSE_REQUESTED, NURSING,
+ FOOD_MAKER_REQUESTED, MAKING_FOOD, CLEANER_REQUESTED, CLEANING) = range(6, 16)
+EGG_STATES = frozenset([NURSERY_WITH_EGG, NURSE_REQUESTED, NURSING])
+PROGRESS_STATES = EGG_STATES | {MAKING_FOOD}
+DIRTY_STATES = frozenset([CLEANER_REQUESTED, CLEANING])
+FOOD_TYPES = frozenset([BEE_BREAD, HONEY])
+
+# Bee jobs
+UNASSIGNED, UNASSIGNED2, NURSE, CLEANER, FOOD_MAKER, BUILDER, DYING = range(7)
+JOB_NAMES = ["unassigned", "unassigned2", "nurse", "cleaner", "food maker", "builder", "dying"]
+WORKER_JOBS = (NURSE, CLEANER, FOOD_MAKER, BUILDER)
+UNASSIGNED_JOBS = (UNASSIGNED, UNASSIGNED2)
+JOB_CHOICES = [(NURSE, CLEANER), (FOOD_MAKER, BUILDER), (), (), (), (), ()]
+JOB_PROMOTIONS = [None, None, UNASSIGNED2, UNASSIGNED2, None, None, None]
+
+# Queen bee keys, as held-key flags
+QB_UP, QB_DOWN, QB_LEFT, QB_RIGHT, QB_LAY = 1, 2, 4, 8, 16
+
+# Player commands, as recorded in input logs
+(BUILD_CELL, MAKE_NURSERY, MAKE_BEE_BREAD, MAKE_HONEY, ASSIGN_JOB, PAUSE,
+ START_OVER, HOLD_KEYS, END_OF_LOG) = range(9)
+LOG_MAGIC = b"BEE2"
+LOG_HEADER = struct.Struct("<4siHHH")
+LOG_ENTRY = struct.Struct("<IBii")
+
+def read_log_header(path):
+    with open(path, "rb") as f:
+        header = f.read(LOG_HEADER.size)
+    if len(header) < LOG_HEADER.size or not header.startswith(LOG_MAGIC):
+        raise ValueError("%s is not an input log" % path)
+    magic, seed, width, height, comb_radius = LOG_HEADER.unpack(header)
+    return seed, width, height, comb_radius
+
+BEE_SPEED = 4
+QB_SPEED = 4
+# how many of the oldest pending cells are matched against idle bees at a time
+DISPATCH_WINDOW = 16
+
+SQRT3 = math.sqrt(3)
+CELL_PROGRESS_STEPS = 32
+CHUNK_CELLS = 16
+
+def cell_center(row, col):
+    return (COMB_ORIGIN[0] + (col * 2 + row % 2) * CELL_SIZE * SQRT3, COMB_ORIGIN[1] + row * CELL_SIZE * 3)
+
+def pixel_to_hex(point):
+    size = CELL_SIZE * 2
+    x = point[0] - COMB_ORIGIN[0]
+    y = point[1] - COMB_ORIGIN[1]
+    q = (SQRT3 / 3 * x - y / 3) / size
+    r = y * 2 / 3 / size
+    s = -q - r
+    rq, rr, rs = round(q), round(r), round(s)
+    dq, dr, ds = abs(rq - q), abs(rr - r), abs(rs - s)
+    if dq > dr and dq > ds:
+        rq = -rr - rs
+    elif dr > ds:
+        rr = -rq - rs
+    return rr, rq + (rr - (rr & 1)) // 2
+
+def distance(a, b):
+    return math.sqrt((b[0] - a[0]) ** 2 + (b[1] - a[1]) ** 2)
+
+def move_point(p, dx, dy):
+    return (p[0] + dx, p[1] + dy)
+
+def random_in_rect(rect):
+    return (hive.random.randint(rect.left, rect.right), hive.random.randint(rect.top, rect.bottom))
+
+def round_away(value):
+    n = int(value)
+    if abs(value - n) >= 0.5:
+        n += 1 if value > 0 else -1
+    return n
+
+
+class Rect(object):
+    # The parts of pygame.Rect the simulation uses, rounding the same way, so a hive laid out here
+    # matches one laid out with pygame: the constructor truncates, moving the center rounds half away from zero
+    __slots__ = ("x", "y", "width", "height")
+
+    def __init__(self, x, y, width, height):
+        self.x = int(x)
+        self.y = int(y)
+        self.width = int(width)
+        self.height = int(height)
+
+    @property
+    def left(self):
+        return self.x
+
+    @property
+    def top(self):
+        return self.y
+
+    @property
+    def right(self):
+        return self.x + self.width
+
+    @property
+    def bottom(self):
+        return self.y + self.height
+
+    @property
+    def topleft(self):
+        return (self.x, self.y)
+
+    @property
+    def bottomright(self):
+        return (self.x + self.width, self.y + self.height)
+
+    @property
+    def midtop(self):
+        return (self.x + self.width // 2, self.y)
+
+    @property
+    def center(self):
+        return (self.x + self.width // 2, self.y + self.height // 2)
+
+    @center.setter
+    def center(self, point):
+        self.x = round_away(point[0]) - self.width // 2
+        self.y = round_away(point[1]) - self.height // 2
+
+    def collidepoint(self, point):
+        x, y = int(point[0]), int(point[1])
+        return self.x <= x < self.x + self.width and self.y <= y < self.y + self.height
+
+    def inflate(self, dx, dy):
+        dx, dy = int(dx), int(dy)
+        return Rect(self.x - int(dx / 2), self.y - int(dy / 2), self.width + dx, self.height + dy)
+
+    def unionall(self, rects):
+        rects = [self] + list(rects)
+        left = min(rect.left for rect in rects)
+        top = min(rect.top for rect in rects)
+        return Rect(left, top, max(rect.right for rect in rects) - left, max(rect.bottom for rect in rects) - top)
+
+    def copy(self):
+        return Rect(self.x, self.y, self.width, self.height)
+
+
+class Task(object):
+    total_time = None
+    cell = None
+    def start(self, bee):
+        pass
+    def update(self):
+        pass
+    def is_done(self):
+        pass
+    def finish(self):
+        pass
+    def get_progress(self):
+        return (hive.tick - self.start_tick) / self.total_time
+
+class TravelTo(Task):
+    def __init__(self, dest):
+        super().__init__()
+        self.dest = dest
+    
+    def start(self, bee):
+        self.bee = bee
+        dist = distance(bee.center, self.dest)
+        self.dx = (self.dest[0] - bee.center[0]) / dist * BEE_SPEED
+        self.dy = (self.dest[1] - bee.center[1]) / dist * BEE_SPEED
+
+    def update(self):
+        self.bee.move_to(move_point(self.bee.center, self.dx, self.dy))
+    
+    def is_done(self):
+        return distance(self.bee.center, self.dest) < 10
+
+class Build(Task):
+    total_time = FPS * 3
+    def __init__(self, cell):
+        super().__init__()
+        self.cell = cell
+    def start(self, bee):
+        self.cell.state = BUILDING
+    def finish(self):
+        self.cell.state = READY
+        self.cell.type = BUILT
+        hive.enable_cells_around(self.cell)
+
+class Nurse(Task):
+    total_time = FPS * 5
+    def __init__(self, cell):
+        super().__init__()
+        self.cell = cell
+    def start(self, bee):
+        self.cell.state = NURSING
+        self.cell.timer = self
+    def finish(self):
+        self.cell.state = CLEANER_REQUESTED
+        hive.request_cleaner(self.cell)
+        self.cell.timer = None
+        new_bee = Bee(self.cell.rect.center[0], self.cell.rect.center[1], UNASSIGNED)
+        new_bee.add_tasks([
+            TravelTo(random_in_rect(job_rect)),
+            GetJob(),
+        ])
+        hive.add_bee(new_bee)
+
+class Clean(Task):
+    total_time = FPS * 4
+    def __init__(self, cell):
+        super().__init__()
+        self.cell = cell
+    def start(self, bee):
+        self.cell.state = CLEANING
+        self.cell.timer = None
+    def finish(self):
+        self.cell.state = self.cell.type
+        hive.cell_changed(self.cell)
+
+class MakeFood(Task):
+    total_time = FPS * 5
+    def __init__(self, cell):
+        super().__init__()
+        self.cell = cell
+    def start(self, bee):
+        self.cell.state = MAKING_FOOD
+        self.cell.timer = self
+    def finish(self):
+        if self.cell.type == HONEY:
+            hive.honey = min(100, hive.honey + 4)
+        elif self.cell.type == BEE_BREAD:
+            hive.bee_bread = min(20, hive.bee_bread + 1)
+        self.cell.state = CLEANER_REQUESTED
+        hive.request_cleaner(self.cell)
+        self.cell.timer = None
+
+class Die(Task):
+    total_time = FPS * 2
+    def start(self, bee):
+        self.bee = bee
+        bee.set_job(DYING)
+    def finish(self):
+        hive.remove_bee(self.bee)
+
+
+class GetJob(Task):
+    total_time = 0
+    def start(self, bee):
+        hive.bees_needing_jobs.push(bee)
+
+
+class SpatialHash(object):
+    def __init__(self, bucket_size):
+        self.bucket_size = bucket_size
+        self.buckets = defaultdict(dict)
+        self.keys = {}
+
+    def key(self, point):
+        return (int(point[0] // self.bucket_size), int(point[1] // self.bucket_size))
+
+    def move(self, id, item, point):
+        key = self.key(point)
+        old_key = self.keys.get(id)
+        if key != old_key:
+            if old_key is not None:
+                self.discard(old_key, id)
+            self.buckets[key][id] = item
+            self.keys[id] = key
+            return True
+        return False
+
+    def remove(self, id):
+        key = self.keys.pop(id, None)
+        if key is not None:
+            self.discard(key, id)
+
+    def discard(self, key, id):
+        bucket = self.buckets[key]
+        del bucket[id]
+        if len(bucket) == 0:
+            del self.buckets[key]
+
+    def nearest(self, point, position):
+        # search rings of buckets outwards until nothing further out can be closer,
+        # or just look at every bucket once the rings would cover more than that
+        if len(self.keys) == 0:
+            return None
+        x, y = self.key(point)
+        best = None
+        r = 0
+        while (2 * r + 1) ** 2 <= len(self.buckets):
+            if r == 0:
+                ring = [(x, y)]
+            else:
+                ring = [ (i, j) for i in range(x - r, x + r + 1) for j in [y - r, y + r] ]
+                ring += [ (i, j) for j in range(y - r + 1, y + r) for i in [x - r, x + r] ]
+            for key in ring:
+                bucket = self.buckets.get(key)
+                if bucket:
+                    best = self.closest(point, position, bucket, best)
+            if best is not None and best[0] <= r * self.bucket_size:
+                return best
+            r += 1
+        for bucket in self.buckets.values():
+            best = self.closest(point, position, bucket, best)
+        return best
+
+    def closest(self, point, position, bucket, best):
+        for id, item in bucket.items():
+            candidate = (distance(point, position(item)), id, item)
+            if best is None or candidate[:2] < best[:2]:
+                best = candidate
+        return best
+
+    def query(self, rect):
+        left, top = self.key(rect.topleft)
+        right, bottom = self.key(rect.bottomright)
+        for i in range(left, right + 1):
+            for j in range(top, bottom + 1):
+                bucket = self.buckets.get((i, j))
+                if bucket:
+                    yield from bucket.values()
+
+
+class SwarmArrays(object):
+    def __init__(self, bucket_size, capacity = 1024):
+        self.bucket_size = bucket_size
+        self.pos = np.zeros((capacity, 2))
+        self.vel = np.zeros((capacity, 2))
+        self.dest = np.zeros((capacity, 2))
+        self.order = np.zeros(capacity, dtype=np.int64)
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.bees = []
+        self.slots = {}
+        self.next_order = 0
+
+    def grow(self):
+        capacity = len(self.pos) * 2
+        for name in ["pos", "vel", "dest", "order", "ids"]:
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def add(self, bee):
+        if len(self.bees) == len(self.pos):
+            self.grow()
+        i = len(self.bees)
+        self.pos[i] = bee.center
+        self.vel[i] = (bee.task.dx, bee.task.dy)
+        self.dest[i] = bee.task.dest
+        self.order[i] = self.next_order
+        self.ids[i] = bee.id
+        self.next_order += 1
+        self.bees.append(bee)
+        self.slots[bee.id] = i
+
+    def remove(self, bee):
+        i = self.slots.pop(bee.id)
+        bee.move_to(tuple(self.pos[i].tolist()))
+        last = len(self.bees) - 1
+        if i != last:
+            for array in [self.pos, self.vel, self.dest, self.order, self.ids]:
+                array[i] = array[last]
+            moved = self.bees[last]
+            self.bees[i] = moved
+            self.slots[moved.id] = i
+        self.bees.pop()
+
+    def step(self):
+        n = len(self.bees)
+        pos = self.pos[:n]
+        delta = self.dest[:n] - pos
+        done = np.sqrt(delta[:, 0] ** 2 + delta[:, 1] ** 2) < 10
+        buckets = pos // self.bucket_size
+        np.add(pos, self.vel[:n], out=pos, where=~done[:, None])
+        # keep the spatial hashes exact by syncing the bees that moved into another bucket
+        for i in np.flatnonzero((pos // self.bucket_size != buckets).any(axis=1)).tolist():
+            self.bees[i].move_to(tuple(pos[i].tolist()))
+        arrived = np.flatnonzero(done)
+        arrived = arrived[np.argsort(self.order[arrived])]
+        return [ self.bees[i] for i in arrived ]
+
+    def sync(self):
+        for bee, center in zip(self.bees, self.pos[:len(self.bees)].tolist()):
+            bee.move_to(tuple(center))
+
+
+class WorkQueue(object):
+    # pending items in the order they were pushed; an OrderedDict finds its first key in constant time,
+    # where a plain dict scans past the slots of every item already taken off the front
+    def __init__(self):
+        self.pending = OrderedDict()
+
+    def push(self, item):
+        if item not in self.pending:
+            self.pending[item] = None
+
+    def cancel(self, item):
+        self.pending.pop(item, None)
+
+    def peek(self):
+        return next(iter(self.pending), None)
+
+    def first(self, n):
+        return list(itertools.islice(self.pending, n))
+
+    def pop(self):
+        if len(self.pending) == 0:
+            return None
+        return self.pending.popitem(last=False)[0]
+
+    def __len__(self):
+        return len(self.pending)
+
+    def __contains__(self, item):
+        return item in self.pending
+
+    def __iter__(self):
+        return iter(self.pending)
+
+
+class Hive(object):
+    def __init__(self, bees = [], cells = [], seed = None, comb_radius = 0):
+        pass
+        self.honey = 20
+        self.bee_bread = 5
+        self.bees = {}
+        self.cells = cells
+        self.cells_needing_builder = WorkQueue()
+        self.cells_needing_food_maker = WorkQueue()
+        self.cells_needing_nurse = WorkQueue()
+        self.cells_needing_cleaner = WorkQueue()
+        self.bees_needing_jobs = WorkQueue()
+        self.debug = False
+        self.paused = False
+        self.speed = 1
+        self.seed = seed
+        self.comb_radius = comb_radius
+        self.random = random.Random(seed)
+        self.tick = 0
+        self.task_starts = 0
+        self.task_finishes = 0
+        self.events = []
+        self.scheduled = 0
+        self.next_event_id = 0
+        self.travellers = {}
+        self.swarm = SwarmArrays(BEE_GRID_SIZE) if USE_NUMPY else None
+        self.next_id = 1
+        self.idle_bees = [{} for job in JOB_NAMES]
+        self.idle_grids = [SpatialHash(BEE_GRID_SIZE) for job in JOB_NAMES]
+        self.dispatch_scheduled = False
+        # cells and bees touched since a --split publisher last looked, while one is watching
+        self.changed_cells = None
+        self.changed_bees = None
+        self.job_counts = [0] * len(JOB_NAMES)
+        self.job_queues = [None] * len(JOB_NAMES)
+        self.job_queues[BUILDER] = self.cells_needing_builder
+        self.job_queues[NURSE] = self.cells_needing_nurse
+        self.job_queues[FOOD_MAKER] = self.cells_needing_food_maker
+        self.job_queues[CLEANER] = self.cells_needing_cleaner
+        self.job_assigners = [None] * len(JOB_NAMES)
+        self.job_assigners[BUILDER] = self.assign_builder
+        self.job_assigners[NURSE] = self.assign_nurse
+        self.job_assigners[FOOD_MAKER] = self.assign_food_maker
+        self.job_assigners[CLEANER] = self.assign_cleaner
+        self.bee_grid = SpatialHash(BEE_GRID_SIZE)
+        self.cell_grid = SpatialHash(CELL_SIZE * SQRT3 * 2 * CHUNK_CELLS)
+        self.cell_dict = {}
+        screen = Rect(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)
+        self.bounds = screen.unionall([ cell.rect for cell in cells ]) if cells else screen
+        for bee in bees:
+            self.assign_id(bee)
+            self.bees[bee.id] = bee
+            self.bee_grid.move(bee.id, bee, bee.center)
+            self.count_bee(bee, 1)
+            self.pool_bee(bee)
+            bee.meal_event = self.schedule(MEAL_TIME, bee.eat)
+            self.schedule(0, bee.wake)
+        for cell in cells:
+            self.cell_dict[(cell.row, cell.col)] = cell
+            self.cell_grid.move((cell.row, cell.col), cell, cell.rect.center)
+
+    def get_cell(self, r, c):
+        return self.cell_dict.get((r, c))
+
+    def cell_at(self, point):
+        row, col = pixel_to_hex(point)
+        for c in [col, col - 1, col + 1]:
+            cell = self.get_cell(row, c)
+            if cell is not None and cell.rect.collidepoint(point):
+                return cell
+        return None
+
+    def cells_in_rect(self, rect):
+        area = rect.inflate(CELL_SIZE * 4 + 4, CELL_SIZE * 4 + 4)
+        cells = [ cell for cell in self.cell_grid.query(area) if area.collidepoint(cell.rect.center) ]
+        cells.sort(key=lambda cell: (cell.row, cell.col))
+        return cells
+
+    def bees_in_rect(self, rect):
+        bees = { bee.id: bee for bee in self.bee_grid.query(rect.inflate(BEE_SIZE * 8, BEE_SIZE * 12)) }
+        waiting = self.bees_needing_jobs.peek()
+        if waiting is not None:
+            bees[waiting.id] = waiting
+        return [ bees[id] for id in sorted(bees) ]
+
+    def get_neighbors(self, cell):
+        neighbors = []
+        for r, c in [(-1, -1), (-1, 0), (0, 1), (1, 0), (1, -1), (0, -1)]:
+            a = 0 if r == 0 else cell.row % 2
+            neighbors.append(self.get_cell(cell.row + r, cell.col + c + a))
+        return neighbors
+
+    def assign_id(self, bee):
+        bee.id = self.next_id
+        self.next_id += 1
+
+    def add_bee(self, bee):
+        self.assign_id(bee)
+        self.bees[bee.id] = bee
+        self.bee_grid.move(bee.id, bee, bee.center)
+        self.count_bee(bee, 1)
+        self.pool_bee(bee)
+        self.mark_bee(bee)
+        bee.meal_event = self.schedule(MEAL_TIME, bee.eat)
+        self.bee_bread -= 1
+
+    def remove_bee(self, bee):
+        self.mark_bee(bee)
+        self.unpool_bee(bee)
+        self.count_bee(bee, -1)
+        self.bees_needing_jobs.cancel(bee)
+        self.bees.pop(bee.id, None)
+        self.bee_grid.remove(bee.id)
+        self.stop_travel(bee)
+        self.cancel(bee.meal_event)
+        self.cancel(bee.task_event)
+
+    def schedule(self, delay, fn):
+        event = [self.tick + delay, self.next_event_id, fn]
+        self.next_event_id += 1
+        heapq.heappush(self.events, event)
+        self.scheduled += 1
+        return event
+
+    def cancel(self, event):
+        if event is not None and event[2] is not None:
+            event[2] = None
+            self.scheduled -= 1
+
+    def next_event_tick(self):
+        while len(self.events) > 0 and self.events[0][2] is None:
+            heapq.heappop(self.events)
+        if len(self.events) > 0:
+            return self.events[0][0]
+        return None
+
+    def start_travel(self, bee):
+        self.travellers[bee.id] = bee
+        if self.swarm is not None:
+            self.swarm.add(bee)
+
+    def stop_travel(self, bee):
+        if self.travellers.pop(bee.id, None) is not None and self.swarm is not None:
+            self.swarm.remove(bee)
+
+    def sync_positions(self):
+        if self.swarm is not None:
+            self.swarm.sync()
+
+    def step(self, profiler = None):
+        if profiler is not None:
+            t = time.perf_counter()
+        self.tick += 1
+        self.move_travellers()
+        if profiler is not None:
+            t = profiler.lap("move", t)
+        self.fire_events()
+        if profiler is not None:
+            profiler.lap("events", t)
+
+    def move_travellers(self):
+        if self.swarm is not None:
+            for bee in self.swarm.step():
+                self.stop_travel(bee)
+                bee.finish_task()
+        else:
+            for bee in list(self.travellers.values()):
+                if bee.task.is_done():
+                    del self.travellers[bee.id]
+                    bee.finish_task()
+                else:
+                    bee.task.update()
+
+    def fire_events(self):
+        while len(self.events) > 0 and self.events[0][0] <= self.tick:
+            event = heapq.heappop(self.events)
+            fn = event[2]
+            if fn is not None:
+                # a fired event can no longer be cancelled
+                event[2] = None
+                self.scheduled -= 1
+                fn()
+
+    def skip_idle_ticks(self, end):
+        if len(self.travellers) == 0:
+            tick = self.next_event_tick()
+            self.tick = max(self.tick, min(end if tick is None else tick, end) - 1)
+
+    def count_bee(self, bee, n):
+        if bee.id in self.bees:
+            self.job_counts[bee.job] += n
+
+    def pool_bee(self, bee):
+        if bee.is_idle and bee.id is not None:
+            self.idle_bees[bee.job][bee.id] = bee
+            self.idle_grids[bee.job].move(bee.id, bee, bee.center)
+
+    def unpool_bee(self, bee):
+        if self.idle_bees[bee.job].pop(bee.id, None) is not None:
+            self.idle_grids[bee.job].remove(bee.id)
+
+    def bee_position(self, bee):
+        if self.swarm is not None and bee.id in self.swarm.slots:
+            return tuple(self.swarm.pos[self.swarm.slots[bee.id]].tolist())
+        return bee.center
+
+    def is_collapsed(self):
+        # several bees can eat in one tick, so honey can jump past zero
+        return self.honey <= 0 or self.bee_bread <= 0 or len(self.bees) == 0
+
+    def is_first_bee_waiting_for_job(self, bee):
+        return self.bees_needing_jobs.peek() is bee
+
+    def assign_job(self, job):
+        bee = self.bees_needing_jobs.peek()
+        if bee is not None:
+            if job in JOB_CHOICES[bee.job]:
+                bee.set_job(job)
+                self.bees_needing_jobs.pop()
+
+    def request_job(self, bee):
+        queue = self.job_queues[bee.job]
+        if queue is not None and len(queue) > 0:
+            position = self.bee_position(bee)
+            cell = min(queue.first(DISPATCH_WINDOW), key=lambda cell: distance(position, cell.rect.center))
+            queue.cancel(cell)
+            self.job_assigners[bee.job](cell, bee)
+
+    def request_worker(self, job, cell):
+        self.mark_cell(cell)
+        self.job_queues[job].push(cell)
+        if not self.dispatch_scheduled:
+            self.dispatch_scheduled = True
+            self.schedule(0, self.dispatch)
+
+    def dispatch(self):
+        # greedily pair the closest pending cell and idle bee until one side runs out
+        self.dispatch_scheduled = False
+        for job in WORKER_JOBS:
+            queue = self.job_queues[job]
+            grid = self.idle_grids[job]
+            while len(self.idle_bees[job]) > 0:
+                cells = queue.first(DISPATCH_WINDOW)
+                if len(cells) == 0:
+                    break
+                nearest = {}
+                while len(cells) > 0 and len(self.idle_bees[job]) > 0:
+                    for cell in cells:
+                        if cell not in nearest:
+                            nearest[cell] = grid.nearest(cell.rect.center, self.bee_position)
+                    cell = min(cells, key=lambda cell: nearest[cell][:2])
+                    bee = nearest[cell][2]
+                    cells.remove(cell)
+                    queue.cancel(cell)
+                    self.job_assigners[job](cell, bee)
+                    nearest = { c: match for c, match in nearest.items() if match[2] is not bee }
+
+    def request_builder(self, cell):
+        cell.state = BUILD_REQUESTED
+        self.request_worker(BUILDER, cell)
+
+    def assign_builder(self, cell, bee):
+        bee.add_tasks([
+            TravelTo(cell.rect.center),
+            Build(cell),
+        ])
+
+    def request_nurse(self, cell):
+        cell.state = NURSE_REQUESTED
+        self.request_worker(NURSE, cell)
+    
+    def assign_nurse(self, cell, bee):
+        bee.add_tasks([
+            TravelTo(cell.rect.center),
+            Nurse(cell),
+        ])
+
+    def request_food_maker(self, cell):
+        cell.state = FOOD_MAKER_REQUESTED
+        self.request_worker(FOOD_MAKER, cell)
+
+    def assign_food_maker(self, cell, bee):
+        bee.add_tasks([
+            TravelTo(cell.rect.center),
+            MakeFood(cell),
+        ])
+
+    def request_cleaner(self, cell):
+        cell.state = CLEANER_REQUESTED
+        self.request_worker(CLEANER, cell)
+
+    def assign_cleaner(self, cell, bee):
+        bee.add_tasks([
+            TravelTo(cell.rect.center),
+            Clean(cell),
+        ])
+
+    def mark_cell(self, cell):
+        if self.changed_cells is not None and cell is not None:
+            self.changed_cells.add(cell)
+
+    def mark_bee(self, bee):
+        if self.changed_bees is not None:
+            self.changed_bees.add(bee)
+
+    def cell_changed(self, cell):
+        self.schedule(0, cell.on_ready)
+
+    def get_bee(self, job):
+        idle_bees = self.idle_bees[job]
+        if len(idle_bees) > 0:
+            return next(iter(idle_bees.values()))
+        return None
+
+    def is_built(self, cell):
+        return cell is not None and cell.type > UNBUILT
+
+    def enable_cell(self, cell):
+        neighbors = self.get_neighbors(cell)
+        for n1, n2 in itertools.pairwise(neighbors + neighbors[:1]):
+            if self.is_built(n1) and self.is_built(n2):
+                cell.type = UNBUILT
+                cell.state = UNBUILT
+                self.mark_cell(cell)
+                return True
+        return False
+
+    def enable_cells(self):
+        for cell in self.cells:
+            if cell.type == EMPTY:
+                self.enable_cell(cell)
+
+    def enable_cells_around(self, cell):
+        for neighbor in self.get_neighbors(cell):
+            if neighbor is not None and neighbor.type == EMPTY:
+                self.enable_cell(neighbor)
+
+class Cell(object):
+    __slots__ = ("row", "col", "rect", "type", "state", "timer")
+
+    def __init__(self, row, col, typ = EMPTY):
+        self.row = row
+        self.col = col
+        self.rect = Rect(0, 0, CELL_SIZE * SQRT3 * 2, CELL_SIZE * 2)
+        self.rect.center = cell_center(row, col)
+        self.type = typ
+        self.state = typ
+        self.timer = None
+
+    def on_ready(self):
+        if self.type in FOOD_TYPES and self.state == self.type:
+            hive.request_food_maker(self)
+
+    def make_nursery(self):
+        self.type = NURSERY
+        self.state = NURSERY
+        hive.mark_cell(self)
+ 
+    def request_honey(self):
+        self.type = HONEY
+        hive.request_food_maker(self)
+
+    def request_bee_bread(self):
+        self.type = BEE_BREAD
+        hive.request_food_maker(self)
+
+    def get_progress(self):
+        if self.timer is None:
+            return 0
+        return self.timer.get_progress()
+
+    def sprite_key(self):
+        if self.state in PROGRESS_STATES:
+            return (self.type, self.state, int(self.get_progress() * CELL_PROGRESS_STEPS))
+        return (self.type, self.state, 0)
+
+
+class Bee(object):
+    __slots__ = ("center", "id", "job", "tasks", "task", "is_idle", "resting",
+                 "meals", "meal_event", "task_event")
+
+    def __init__(self, x, y, job):
+        self.center = (x, y)
+        self.id = None
+        self.job = job
+        self.tasks = deque()
+        self.task = None
+        self.is_idle = True
+        self.resting = False
+        self.meals = 0
+        self.meal_event = None
+        self.task_event = None
+
+    def eat(self):
+        hive.honey -= 1
+        self.meals += 1
+        self.meal_event = hive.schedule(MEAL_TIME, self.eat)
+        if self.task is None:
+            self.next_task()
+
+    def wake(self):
+        if self.task is None:
+            self.next_task()
+
+    def start_task(self, task):
+        self.task = task
+        self.resting = False
+        task.start_tick = hive.tick
+        hive.task_starts += 1
+        task.start(self)
+        hive.mark_cell(task.cell)
+        if task.total_time is None:
+            hive.start_travel(self)
+        else:
+            self.task_event = hive.schedule(task.total_time, self.finish_task)
+
+    def finish_task(self):
+        self.task_event = None
+        hive.task_finishes += 1
+        self.task.finish()
+        hive.mark_cell(self.task.cell)
+        if self.id in hive.bees:
+            self.next_task()
+
+    def next_task(self):
+        if self.meals == 3 and JOB_PROMOTIONS[self.job] is not None:
+            self.set_job(JOB_PROMOTIONS[self.job])
+            self.add_tasks([
+                TravelTo(random_in_rect(job_rect)),
+                GetJob(),
+            ])
+        elif self.meals == 6:
+            self.add_tasks([
+                TravelTo(random_in_rect(die_rect)),
+                Die(),
+            ])
+
+        if len(self.tasks) == 0 and self.job not in UNASSIGNED_JOBS:
+            hive.request_job(self)
+        if len(self.tasks) > 0:
+            self.start_task(self.tasks.popleft())
+        elif self.job in UNASSIGNED_JOBS or self.resting or (self.is_idle and self.task is not None):
+            self.task = None
+            self.resting = self.job not in UNASSIGNED_JOBS
+            self.set_idle(True)
+        else:
+            self.start_task(TravelTo(random_in_rect(idle_rect)))
+            self.set_idle(True)
+
+    def move_to(self, center):
+        self.center = center
+        if hive.changed_bees is not None:
+            hive.changed_bees.add(self)
+        if self.id in hive.bees:
+            # the idle grids share the bee grid's buckets, so they only change when it does
+            if hive.bee_grid.move(self.id, self, center) and self.id in hive.idle_bees[self.job]:
+                hive.idle_grids[self.job].move(self.id, self, center)
+
+    def set_job(self, job):
+        hive.unpool_bee(self)
+        hive.count_bee(self, -1)
+        self.job = job
+        hive.mark_bee(self)
+        hive.count_bee(self, 1)
+        hive.pool_bee(self)
+        if self.task is None:
+            hive.schedule(0, self.wake)
+
+    def set_idle(self, is_idle):
+        self.is_idle = is_idle
+        if is_idle:
+            hive.pool_bee(self)
+        else:
+            hive.unpool_bee(self)
+
+    def add_task(self, task):
+        self.add_tasks([task])
+    
+    def add_tasks(self, tasks):
+        self.set_idle(False)
+        for task in tasks:
+            self.tasks.append(task)
+        if self.task is None:
+            hive.schedule(0, self.wake)
+    
+    def is_busy(self):
+        return not self.is_idle
+    
+
+class QueenBee(object):
+    __slots__ = ("center",)
+
+    def __init__(self, x, y):
+        self.center = (x, y)
+
+    def update(self, held = 0):
+        bounds = hive.bounds
+        if held & QB_UP and self.center[1] > bounds.top:
+            self.center = move_point(self.center, 0, -QB_SPEED)
+        if held & QB_DOWN and self.center[1] < bounds.bottom:
+            self.center = move_point(self.center, 0, QB_SPEED)
+        if held & QB_LEFT and self.center[0] > bounds.left:
+            self.center = move_point(self.center, -QB_SPEED, 0)
+        if held & QB_RIGHT and self.center[0] < bounds.right:
+            self.center = move_point(self.center, QB_SPEED, 0)
+        if held & QB_LAY:
+            cell = hive.cell_at(self.center)
+            if cell is not None and cell.state == NURSERY:
+                cell.state = NURSERY_WITH_EGG
+                hive.request_nurse(cell)
+
+
+hive = None
+def generate_comb(radius, seed):
+    # a blob whose edge wobbles with a few random harmonics around a circle of the given radius
+    rng = random.Random(seed)
+    harmonics = [ (k, rng.uniform(0, 0.1), rng.uniform(0, math.tau)) for k in range(2, 6) ]
+    spacing = CELL_SIZE * SQRT3 * 2
+    reach = math.ceil(radius * (1 + sum(a for k, a, phase in harmonics)) * 2 / SQRT3) + 1
+    cells = []
+    for r in range(-reach, reach + 1):
+        for c in range(-reach, reach + 1):
+            x, y = cell_center(r, c)
+            x, y = (x - COMB_ORIGIN[0]) / spacing, (y - COMB_ORIGIN[1]) / spacing
+            angle = math.atan2(y, x)
+            edge = radius * (1 + sum(a * math.sin(k * angle + phase) for k, a, phase in harmonics))
+            if math.hypot(x, y) <= edge:
+                typ = UNBUILT if (r == 0 and c == 0) or (r == 1 and c in [-1, 0]) else EMPTY
+                cells.append(Cell(r, c, typ))
+    return cells
+
+def classic_comb():
+    cells = []
+    row_indexes = {
+        -3: range (-2, 3),
+        -2: range(-3, 5),
+        -1: range(-4, 5),
+        0: range(-3, 6),
+        1: range(-3, 5),
+        2: range(-2, 4),
+        3: range(-2, 3),
+    }
+    for r, cell_range in row_indexes.items():
+        for c in cell_range:
+            typ = UNBUILT if (r == 0 and c == 0) or (r == 1 and c in [-1, 0]) else EMPTY
+            cells.append(Cell(r, c, typ))
+    return cells
+
+def init(seed = None, comb_radius = 0):
+    global hive
+    if seed is None:
+        seed = random.randrange(2 ** 31)
+    if comb_radius > 0:
+        cells = generate_comb(comb_radius, seed)
+    else:
+        cells = classic_comb()
+
+    hive = Hive(
+        cells = cells,
+        bees = [Bee(100, 100, NURSE), Bee(200, 100, BUILDER), Bee(300, 100, CLEANER), Bee(400, 100, FOOD_MAKER)],
+        seed = seed,
+        comb_radius = comb_radius,
+    )
+
+# a hexagonal comb with its middle built, bees of every worker job spread over the screen and food that
+# never runs out, for the benchmarks and tests to drive with tend_colony
+COLONY_CELL_TYPES = [NURSERY, HONEY, BEE_BREAD, HONEY, BUILT]
+
+def hex_distance(row, col):
+    x = col - (row - (row & 1)) // 2
+    return max(abs(x), abs(row), abs(x + row))
+
+def build_colony(bees, radius, seed = 1):
+    global hive
+    cells = []
+    for row in range(-radius, radius + 1):
+        for col in range(-radius - abs(row), radius + abs(row) + 1):
+            d = hex_distance(row, col)
+            if d > radius:
+                continue
+            typ = EMPTY
+            if d <= radius // 2:
+                typ = COLONY_CELL_TYPES[(row * 7 + col) % len(COLONY_CELL_TYPES)]
+            cells.append(Cell(row, col, typ))
+    rng = random.Random(seed)
+    bee_list = [
+        Bee(rng.uniform(0, SCREEN_WIDTH), rng.uniform(0, SCREEN_HEIGHT), WORKER_JOBS[i % len(WORKER_JOBS)])
+        for i in range(bees)
+    ]
+    hive = Hive(bees = bee_list, cells = cells, seed = seed)
+    hive.honey = hive.bee_bread = 10 ** 9
+    controls.held = 0
+    hive.enable_cells()
+    for cell in cells:
+        if cell.type in FOOD_TYPES:
+            hive.request_food_maker(cell)
+    return hive
+
+def tend_colony(hive, job_turn = 0):
+    # play like a busy player: build everything, lay in every nursery and hand out jobs, alternating by job_turn
+    for cell in hive.cells:
+        if cell.state == UNBUILT:
+            hive.request_builder(cell)
+        elif cell.state == NURSERY:
+            cell.state = NURSERY_WITH_EGG
+            hive.request_nurse(cell)
+    while len(hive.bees_needing_jobs) > 0:
+        choices = JOB_CHOICES[hive.bees_needing_jobs.peek().job]
+        if not choices:
+            break
+        hive.assign_job(choices[job_turn % 2])
+
+def pause():
+    hive.paused = not hive.paused
+
+def start_over():
+    controls.post(START_OVER, random.randrange(2 ** 31))
+
+def set_speed(speed):
+    hive.speed = speed
+
+def set_screen_size(width, height):
+    # the comb, the queen and the places bees wander to are laid out in screen pixels,
+    # so this comes before any hive is built
+    global SCREEN_WIDTH, SCREEN_HEIGHT, CELL_SIZE, BEE_SIZE, BEE_GRID_SIZE, COMB_ORIGIN, qb, job_rect, die_rect
+    SCREEN_WIDTH = width
+    SCREEN_HEIGHT = height
+    CELL_SIZE = SCREEN_WIDTH / 40
+    BEE_SIZE = SCREEN_HEIGHT / 30
+    BEE_GRID_SIZE = BEE_SIZE * 4
+    # World coordinates match the screen at the default camera, with cell (0, 0) in the middle
+    COMB_ORIGIN = (SCREEN_WIDTH / 2, SCREEN_HEIGHT / 2)
+    qb = QueenBee(SCREEN_WIDTH - 200, 200)
+    job_rect = Rect(50, SCREEN_HEIGHT * 2 / 3, SCREEN_HEIGHT / 3, SCREEN_HEIGHT / 3 - 50)
+    die_rect = Rect(SCREEN_WIDTH * 3 / 4, SCREEN_HEIGHT * 2 / 3, SCREEN_HEIGHT / 3, SCREEN_HEIGHT / 3 - 50)
+
+def set_backend(use_numpy):
+    # numpy moves all travelling bees in one step; returns whether it is in use
+    global USE_NUMPY, np
+    USE_NUMPY = use_numpy
+    if USE_NUMPY:
+        try:
+            import numpy as np
+        except ImportError:
+            USE_NUMPY = False
+    return USE_NUMPY
+
+np = None
+set_screen_size(*map(int, os.environ.get("BEE_SCREEN", "1920x1080").split("x")))
+set_backend(os.environ.get("BEE_NUMPY") == "1")
+idle_rect = Rect(100, 100, 400, 300)
+
+def apply_command(command, a, b):
+    if command == BUILD_CELL:
+        cell = hive.get_cell(a, b)
+        if cell.state == UNBUILT:
+            hive.request_builder(cell)
+    elif command in [MAKE_NURSERY, MAKE_BEE_BREAD, MAKE_HONEY]:
+        cell = hive.get_cell(a, b)
+        if cell.state == READY:
+            [cell.make_nursery, cell.request_bee_bread, cell.request_honey][command - MAKE_NURSERY]()
+    elif command == ASSIGN_JOB:
+        hive.assign_job(a)
+    elif command == PAUSE:
+        pause()
+    elif command == START_OVER:
+        init(a, hive.comb_radius)
+    elif command == HOLD_KEYS:
+        controls.held = a
+
+class Controls(object):
+    def __init__(self):
+        self.held = 0
+        self.seed = None
+        self.comb_radius = 0
+        self.log = None
+        self.remote = None
+
+    def post(self, command, a = 0, b = 0):
+        if self.remote is not None:
+            self.remote.send(("post", command, a, b))
+            return
+        if self.log is not None:
+            self.log.append((hive.tick, command, a, b))
+        apply_command(command, a, b)
+
+    def hold(self, held):
+        if held != self.held:
+            self.post(HOLD_KEYS, held)
+            self.held = held
+
+    def start_recording(self):
+        self.seed = hive.seed
+        self.comb_radius = hive.comb_radius
+        self.log = []
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(LOG_HEADER.pack(LOG_MAGIC, self.seed, SCREEN_WIDTH, SCREEN_HEIGHT, self.comb_radius))
+            for entry in self.log + [(hive.tick, END_OF_LOG, 0, 0)]:
+                f.write(LOG_ENTRY.pack(*entry))
+
+controls = Controls()
+
+def load_log(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    return list(LOG_ENTRY.iter_unpack(data[LOG_HEADER.size:]))
+
+def replay(path):
+    seed, width, height, comb_radius = read_log_header(path)
+    if (width, height) != (SCREEN_WIDTH, SCREEN_HEIGHT):
+        raise ValueError("%s was recorded at %dx%d" % (path, width, height))
+    init(seed, comb_radius)
+    controls.held = 0
+    for tick, command, a, b in load_log(path):
+        if tick > hive.tick:
+            run_headless(tick - hive.tick)
+        apply_command(command, a, b)
+
+SNAPSHOT_MAGIC = b"HIVE"
+SNAPSHOT_VERSION = 4
+SNAPSHOT_HEADER = struct.Struct("<4sHHHqqqqqqqq?Hdd")
+SNAPSHOT_RANDOM = struct.Struct("<i625I?d")
+SNAPSHOT_COUNT = struct.Struct("<I")
+SNAPSHOT_CELL = struct.Struct("<iiBB")
+SNAPSHOT_CELL_KEY = struct.Struct("<ii")
+SNAPSHOT_BEE = struct.Struct("<IddB??H?H")
+SNAPSHOT_TASK = struct.Struct("<Bq4d")
+SNAPSHOT_ID = struct.Struct("<I")
+SNAPSHOT_EVENT = struct.Struct("<qqBii")
+TASK_TYPES = [TravelTo, Build, Nurse, Clean, MakeFood, Die, GetJob]
+EAT_EVENT, WAKE_EVENT, FINISH_EVENT, READY_EVENT, DISPATCH_EVENT = range(5)
+EVENT_KINDS = { Bee.eat: EAT_EVENT, Bee.wake: WAKE_EVENT, Bee.finish_task: FINISH_EVENT, Cell.on_ready: READY_EVENT, Hive.dispatch: DISPATCH_EVENT }
+BEE_EVENTS = [Bee.eat, Bee.wake, Bee.finish_task]
+
+def pack_task(task, started):
+    kind = TASK_TYPES.index(type(task))
+    start_tick = task.start_tick if started else -1
+    if kind == 0:
+        dx, dy = (task.dx, task.dy) if started else (0, 0)
+        return SNAPSHOT_TASK.pack(kind, start_tick, task.dest[0], task.dest[1], dx, dy)
+    if task.cell is not None:
+        return SNAPSHOT_TASK.pack(kind, start_tick, task.cell.row, task.cell.col, 0, 0)
+    return SNAPSHOT_TASK.pack(kind, start_tick, 0, 0, 0, 0)
+
+def unpack_task(hive, bee, record):
+    kind, start_tick, a, b, c, d = record
+    task_type = TASK_TYPES[kind]
+    if task_type is TravelTo:
+        task = TravelTo((a, b))
+    elif task_type in [Die, GetJob]:
+        task = task_type()
+    else:
+        task = task_type(hive.get_cell(int(a), int(b)))
+    if start_tick >= 0:
+        task.start_tick = start_tick
+        task.bee = bee
+        if task_type is TravelTo:
+            task.dx, task.dy = c, d
+        elif task_type in [Nurse, MakeFood]:
+            task.cell.timer = task
+    return task
+
+def pack_ids(ids):
+    ids = list(ids)
+    return SNAPSHOT_COUNT.pack(len(ids)) + b"".join(SNAPSHOT_ID.pack(id) for id in ids)
+
+def dump_hive(hive):
+    # reads the hive without touching it, so saving mid-run leaves the run exactly as it was
+    version, state, gauss = hive.random.getstate()
+    parts = [
+        SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, SCREEN_WIDTH, SCREEN_HEIGHT, hive.tick, hive.seed, hive.honey, hive.bee_bread,
+                             hive.next_id, hive.task_starts, hive.task_finishes, hive.next_event_id, hive.paused, hive.comb_radius, *qb.center),
+        SNAPSHOT_RANDOM.pack(version, *state, gauss is not None, gauss or 0),
+        SNAPSHOT_COUNT.pack(len(hive.cells)),
+    ]
+    for cell in hive.cells:
+        parts.append(SNAPSHOT_CELL.pack(cell.row, cell.col, cell.type, cell.state))
+    parts.append(SNAPSHOT_COUNT.pack(len(hive.bees)))
+    for bee in hive.bees.values():
+        x, y = hive.bee_position(bee)
+        parts.append(SNAPSHOT_BEE.pack(bee.id, x, y, bee.job, bee.is_idle, bee.resting,
+                                       bee.meals, bee.task is not None, len(bee.tasks)))
+        if bee.task is not None:
+            parts.append(pack_task(bee.task, True))
+        for task in bee.tasks:
+            parts.append(pack_task(task, False))
+    parts.append(pack_ids(hive.travellers))
+    for pool in hive.idle_bees:
+        parts.append(pack_ids(pool))
+    for queue in [hive.cells_needing_builder, hive.cells_needing_nurse, hive.cells_needing_food_maker, hive.cells_needing_cleaner]:
+        parts.append(SNAPSHOT_COUNT.pack(len(queue)))
+        for cell in queue:
+            parts.append(SNAPSHOT_CELL_KEY.pack(cell.row, cell.col))
+    parts.append(pack_ids(bee.id for bee in hive.bees_needing_jobs))
+    events = []
+    for tick, seq, fn in hive.events:
+        if fn is None:
+            continue
+        kind = EVENT_KINDS[fn.__func__]
+        if kind == READY_EVENT:
+            events.append(SNAPSHOT_EVENT.pack(tick, seq, kind, fn.__self__.row, fn.__self__.col))
+        elif kind == DISPATCH_EVENT:
+            events.append(SNAPSHOT_EVENT.pack(tick, seq, kind, 0, 0))
+        elif fn.__self__.id in hive.bees:
+            events.append(SNAPSHOT_EVENT.pack(tick, seq, kind, fn.__self__.id, 0))
+    parts.append(SNAPSHOT_COUNT.pack(len(events)))
+    parts.extend(events)
+    return b"".join(parts)
+
+class SnapshotReader(object):
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+
+    def read(self, record):
+        values = record.unpack_from(self.data, self.offset)
+        self.offset += record.size
+        return values
+
+    def read_bytes(self, size):
+        self.offset += size
+        return self.data[self.offset - size:self.offset]
+
+    def read_count(self):
+        return self.read(SNAPSHOT_COUNT)[0]
+
+    def read_ids(self):
+        return [ self.read(SNAPSHOT_ID)[0] for i in range(self.read_count()) ]
+
+def load_hive(data):
+    reader = SnapshotReader(data)
+    (magic, version, width, height, tick, seed, honey, bee_bread, next_id, task_starts, task_finishes,
+     next_event_id, paused, comb_radius, queen_x, queen_y) = reader.read(SNAPSHOT_HEADER)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        raise ValueError("not a version %d hive snapshot" % SNAPSHOT_VERSION)
+    # bee positions are in world pixels, which only line up with the cells at the same screen size
+    if (width, height) != (SCREEN_WIDTH, SCREEN_HEIGHT):
+        raise ValueError("snapshot was saved at %dx%d" % (width, height))
+    random_state = reader.read(SNAPSHOT_RANDOM)
+    cells = []
+    for i in range(reader.read_count()):
+        row, col, typ, state = reader.read(SNAPSHOT_CELL)
+        cell = Cell(row, col, typ)
+        cell.state = state
+        cells.append(cell)
+
+    loaded = Hive(cells = cells, seed = seed, comb_radius = comb_radius)
+    loaded.random.setstate((random_state[0], random_state[1:626], random_state[627] if random_state[626] else None))
+    loaded.tick = tick
+    loaded.honey = honey
+    loaded.bee_bread = bee_bread
+    loaded.next_id = next_id
+    loaded.task_starts = task_starts
+    loaded.task_finishes = task_finishes
+    loaded.next_event_id = next_event_id
+    loaded.paused = paused
+    qb.center = (queen_x, queen_y)
+    for i in range(reader.read_count()):
+        id, x, y, job, is_idle, resting, meals, has_task, queued = reader.read(SNAPSHOT_BEE)
+        bee = Bee(x, y, job)
+        bee.id = id
+        bee.is_idle = is_idle
+        bee.resting = resting
+        bee.meals = meals
+        if has_task:
+            bee.task = unpack_task(loaded, bee, reader.read(SNAPSHOT_TASK))
+        for j in range(queued):
+            bee.tasks.append(unpack_task(loaded, bee, reader.read(SNAPSHOT_TASK)))
+        loaded.bees[id] = bee
+        loaded.bee_grid.move(id, bee, bee.center)
+        loaded.count_bee(bee, 1)
+    for id in reader.read_ids():
+        loaded.start_travel(loaded.bees[id])
+    for pool, grid in zip(loaded.idle_bees, loaded.idle_grids):
+        for id in reader.read_ids():
+            pool[id] = loaded.bees[id]
+            grid.move(id, pool[id], pool[id].center)
+    for queue in [loaded.cells_needing_builder, loaded.cells_needing_nurse, loaded.cells_needing_food_maker, loaded.cells_needing_cleaner]:
+        for i in range(reader.read_count()):
+            queue.push(loaded.get_cell(*reader.read(SNAPSHOT_CELL_KEY)))
+    for id in reader.read_ids():
+        loaded.bees_needing_jobs.push(loaded.bees[id])
+    for i in range(reader.read_count()):
+        tick, seq, kind, a, b = reader.read(SNAPSHOT_EVENT)
+        if kind == READY_EVENT:
+            event = [tick, seq, loaded.get_cell(a, b).on_ready]
+        elif kind == DISPATCH_EVENT:
+            event = [tick, seq, loaded.dispatch]
+            loaded.dispatch_scheduled = True
+        else:
+            bee = loaded.bees[a]
+            event = [tick, seq, BEE_EVENTS[kind].__get__(bee)]
+            if kind == EAT_EVENT:
+                bee.meal_event = event
+            elif kind == FINISH_EVENT:
+                bee.task_event = event
+        loaded.events.append(event)
+    heapq.heapify(loaded.events)
+    loaded.scheduled = len(loaded.events)
+    return loaded
+
+def save_snapshot(path):
+    with open(path, "wb") as f:
+        f.write(dump_hive(hive))
+
+def load_snapshot(path):
+    global hive
+    with open(path, "rb") as f:
+        hive = load_hive(f.read())
+    return hive
+
+def update(profiler = None):
+    hive.step(profiler)
+    if profiler is None:
+        qb.update(controls.held)
+    else:
+        t = time.perf_counter()
+        qb.update(controls.held)
+        profiler.lap("queen", t)
+    if telemetry is not None:
+        telemetry.record(hive)
+
+def run_headless(ticks):
+    start = hive.tick
+    end = start + ticks
+    while hive.tick < end:
+        if hive.is_collapsed():
+            break
+        if controls.held == 0:
+            hive.skip_idle_ticks(end)
+        update()
+    return hive.tick - start
+
+TELEMETRY_MAGIC = b"BEEM"
+
+class Telemetry(object):
+    COLUMNS = (["tick", "honey", "bee bread"] + [ "%s bees" % name for name in JOB_NAMES ] +
+               ["builder queue", "nurse queue", "food maker queue", "cleaner queue", "job queue", "task starts", "task finishes"])
+    CAPACITY = 4096
+
+    def __init__(self, path, capacity = CAPACITY):
+        self.file = open(path, "wb")
+        self.file.write(TELEMETRY_MAGIC + SNAPSHOT_COUNT.pack(len(self.COLUMNS)))
+        for name in self.COLUMNS:
+            name = name.encode()
+            self.file.write(SNAPSHOT_COUNT.pack(len(name)) + name)
+        self.columns = [ array.array("q", bytes(capacity * 8)) for name in self.COLUMNS ]
+        self.capacity = capacity
+        self.size = 0
+
+    def record(self, hive):
+        i = self.size
+        columns = self.columns
+        columns[0][i] = hive.tick
+        columns[1][i] = hive.honey
+        columns[2][i] = hive.bee_bread
+        for job, count in enumerate(hive.job_counts, 3):
+            columns[job][i] = count
+        columns[10][i] = len(hive.cells_needing_builder.pending)
+        columns[11][i] = len(hive.cells_needing_nurse.pending)
+        columns[12][i] = len(hive.cells_needing_food_maker.pending)
+        columns[13][i] = len(hive.cells_needing_cleaner.pending)
+        columns[14][i] = len(hive.bees_needing_jobs.pending)
+        columns[15][i] = hive.task_starts
+        columns[16][i] = hive.task_finishes
+        self.size = i + 1
+        if self.size == self.capacity:
+            self.flush()
+
+    def flush(self):
+        if self.size == 0:
+            return
+        parts = [SNAPSHOT_COUNT.pack(self.size)]
+        for column in self.columns:
+            parts.append(memoryview(column)[:self.size].tobytes())
+        self.file.write(b"".join(parts))
+        self.size = 0
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+def load_telemetry(path):
+    with open(path, "rb") as f:
+        reader = SnapshotReader(f.read())
+    if reader.read_bytes(len(TELEMETRY_MAGIC)) != TELEMETRY_MAGIC:
+        raise ValueError("%s is not a telemetry file" % path)
+    names = [ reader.read_bytes(reader.read_count()).decode() for i in range(reader.read_count()) ]
+    columns = { name: array.array("q") for name in names }
+    while reader.offset < len(reader.data):
+        rows = reader.read_count()
+        for name in names:
+            columns[name].frombytes(reader.read_bytes(rows * 8))
+    return columns
+
+telemetry = None
+
+
+# Shared snapshot of the hive for --split: a header naming the newest complete slot and the slot being
+# drawn, then three slots so the simulation always has one to write that nobody is reading
+SHARED_HEADER = struct.Struct("<ii")
+SHARED_INDEX = struct.Struct("<i")
+SHARED_POSITION = struct.Struct("<ff")
+SHARED_SLOT = struct.Struct("<qqq7iIidd??2x")
+SHARED_SLOTS = 3
+
+class SharedLayout(object):
+    def __init__(self, cell_count, bee_capacity):
+        self.cell_count = cell_count
+        self.bee_capacity = bee_capacity
+        self.ids = SHARED_SLOT.size
+        self.positions = self.ids + bee_capacity * 4
+        self.jobs = self.positions + bee_capacity * 8
+        self.cells = self.jobs + bee_capacity
+        self.slot_size = (self.cells + cell_count * 3 + 7) // 8 * 8
+        self.size = SHARED_HEADER.size + SHARED_SLOTS * self.slot_size
+
+    def slot(self, index):
+        return SHARED_HEADER.size + index * self.slot_size
+
+
+class SharedHive(object):
+    # Keeps compact tables of what the view draws, updated from the cells and bees the hive marks as changed,
+    # so each publish copies every table into the slot in one slice
+    def __init__(self, conn):
+        self.conn = conn
+        self.hive = None
+        self.shm = None
+        self.layout = None
+
+    def attach(self):
+        self.hive = hive
+        hive.changed_cells = set()
+        hive.changed_bees = set()
+        self.cell_index = { cell: i for i, cell in enumerate(hive.cells) }
+        keys = [ cell.sprite_key() for cell in hive.cells ]
+        self.cells = bytearray(b"".join(bytes([ key[i] for key in keys ]) for i in range(3)))
+        self.progressing = { cell for cell in hive.cells if cell.state in PROGRESS_STATES }
+        self.rows = {}
+        self.bees = []
+        self.ids = array.array("I")
+        self.positions = array.array("f")
+        self.jobs = bytearray()
+        self.row_of_id = np.full(max(1024, hive.next_id), -1, dtype=np.int64) if hive.swarm is not None else None
+        for bee in hive.bees.values():
+            self.add_row(bee)
+        self.allocate()
+
+    def add_row(self, bee):
+        i = len(self.bees)
+        self.rows[bee.id] = i
+        self.bees.append(bee)
+        self.ids.append(bee.id)
+        self.positions.extend(bee.center)
+        self.jobs.append(bee.job)
+        if self.row_of_id is not None:
+            if bee.id >= len(self.row_of_id):
+                self.row_of_id = np.concatenate([self.row_of_id, np.full(len(self.row_of_id), -1, dtype=np.int64)])
+            self.row_of_id[bee.id] = i
+
+    def remove_row(self, bee):
+        # the last row moves into the gap, so the tables stay packed
+        i = self.rows.pop(bee.id)
+        last = len(self.bees) - 1
+        if i != last:
+            moved = self.bees[last]
+            self.bees[i] = moved
+            self.rows[moved.id] = i
+            self.ids[i] = self.ids[last]
+            self.positions[i * 2:i * 2 + 2] = self.positions[last * 2:last * 2 + 2]
+            self.jobs[i] = self.jobs[last]
+            if self.row_of_id is not None:
+                self.row_of_id[moved.id] = i
+        self.bees.pop()
+        self.ids.pop()
+        del self.positions[-2:]
+        self.jobs.pop()
+
+    def update_tables(self):
+        for bee in hive.changed_bees:
+            i = self.rows.get(bee.id)
+            if bee.id not in hive.bees:
+                if i is not None:
+                    self.remove_row(bee)
+            elif i is None:
+                self.add_row(bee)
+            else:
+                self.positions[i * 2], self.positions[i * 2 + 1] = bee.center
+                self.jobs[i] = bee.job
+        hive.changed_bees.clear()
+        swarm = hive.swarm
+        if swarm is not None and len(swarm.bees) > 0:
+            # travelling bees only leave the swarm's arrays when they cross a bucket, so copy them across in one go
+            n = len(swarm.bees)
+            positions = np.frombuffer(self.positions, dtype=np.float32).reshape(-1, 2)
+            positions[self.row_of_id[swarm.ids[:n]]] = swarm.pos[:n]
+            del positions
+
+        n = len(hive.cells)
+        for cell in hive.changed_cells:
+            i = self.cell_index[cell]
+            self.cells[i], self.cells[n + i], self.cells[n * 2 + i] = cell.sprite_key()
+            if cell.state in PROGRESS_STATES:
+                self.progressing.add(cell)
+            else:
+                self.progressing.discard(cell)
+        hive.changed_cells.clear()
+        for cell in self.progressing:
+            self.cells[n * 2 + self.cell_index[cell]] = cell.sprite_key()[2]
+
+    def allocate(self):
+        # a new comb or more bees than fit get a new block, announced with the comb's layout
+        old = self.shm
+        self.layout = SharedLayout(len(hive.cells), max(1024, len(self.bees) * 2))
+        from multiprocessing import shared_memory
+        self.shm = shared_memory.SharedMemory(create=True, size=self.layout.size)
+        SHARED_HEADER.pack_into(self.shm.buf, 0, -1, -1)
+        self.conn.send(("buffer", self.shm.name, self.layout.cell_count, self.layout.bee_capacity,
+                        array.array("i", [ cell.row for cell in hive.cells ]).tobytes(),
+                        array.array("i", [ cell.col for cell in hive.cells ]).tobytes()))
+        if old is not None:
+            old.close()
+            old.unlink()
+
+    def publish(self):
+        if hive is not self.hive:
+            self.attach()
+        self.update_tables()
+        if len(self.bees) > self.layout.bee_capacity:
+            self.allocate()
+        buf = self.shm.buf
+        layout = self.layout
+        latest, reading = SHARED_HEADER.unpack_from(buf, 0)
+        index = next(i for i in range(SHARED_SLOTS) if i != latest and i != reading)
+        offset = layout.slot(index)
+        n = len(self.bees)
+        waiting = hive.bees_needing_jobs.peek()
+        SHARED_SLOT.pack_into(buf, offset, hive.tick, hive.honey, hive.bee_bread, *hive.job_counts, n,
+                              self.rows[waiting.id] if waiting is not None else -1, *qb.center,
+                              hive.paused, hive.is_collapsed())
+        start = offset + layout.ids
+        buf[start:start + n * 4] = memoryview(self.ids).cast("B")
+        start = offset + layout.positions
+        buf[start:start + n * 8] = memoryview(self.positions).cast("B")
+        start = offset + layout.jobs
+        buf[start:start + n] = self.jobs
+        start = offset + layout.cells
+        buf[start:start + len(self.cells)] = self.cells
+        SHARED_INDEX.pack_into(buf, 0, index)
+
+    def close(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+
+
+def run_simulation(conn, screen_size, use_numpy, seed, comb_radius, load, record, save, telemetry_path):
+    global telemetry
+    set_screen_size(*screen_size)
+    set_backend(use_numpy)
+    if load is not None:
+        load_snapshot(load)
+    else:
+        init(seed, comb_radius)
+    if telemetry_path is not None:
+        telemetry = Telemetry(telemetry_path)
+    if record is not None:
+        controls.start_recording()
+    publisher = SharedHive(conn)
+    lag = 0
+    last = time.perf_counter()
+
+    while True:
+        while conn.poll():
+            message = conn.recv()
+            if message[0] == "post":
+                controls.post(*message[1:])
+            elif message[0] == "speed":
+                set_speed(message[1])
+            elif message[0] == "quit":
+                if record is not None:
+                    controls.save(record)
+                if telemetry is not None:
+                    telemetry.close()
+                if save is not None:
+                    save_snapshot(save)
+                publisher.close()
+                conn.close()
+                return
+
+        now = time.perf_counter()
+        lag += (now - last) * FPS * hive.speed
+        last = now
+        if not hive.is_collapsed() and not hive.paused:
+            lag = min(lag, MAX_TICKS_PER_FRAME)
+            while lag >= 1:
+                lag -= 1
+                update()
+                if hive.is_collapsed():
+                    break
+        else:
+            lag = 0
+        publisher.publish()
+        time.sleep(max(0, last + 1 / FPS - time.perf_counter()))
+
+
@@ -1,12 +1,26 @@
-import pygame, sys
+import pygame, sys, os
 import pygame.gfxdraw
 from pygame.locals import *
-import random
 import math
-from collections import defaultdict
-import itertools
-
-FPS = 60
+import time
+import argparse
+import array
+from collections import deque, OrderedDict
+from functools import partial, cached_property
+import colony
+from colony import (
+    FPS, MAX_TICKS_PER_FRAME, SQRT3, CELL_PROGRESS_STEPS,
+    EMPTY, UNBUILT, BEE_BREAD, HONEY, BUILD_REQUESTED, BUILDING, READY, MAKING_FOOD,
+    EGG_STATES, PROGRESS_STATES, DIRTY_STATES,
+    UNASSIGNED, UNASSIGNED2, NURSE, CLEANER, FOOD_MAKER, BUILDER, JOB_NAMES, WORKER_JOBS, UNASSIGNED_JOBS,
+    QB_UP, QB_DOWN, QB_LEFT, QB_RIGHT, QB_LAY,
+    BUILD_CELL, MAKE_NURSERY, MAKE_BEE_BREAD, MAKE_HONEY, ASSIGN_JOB, PAUSE,
+    SNAPSHOT_ID, SHARED_HEADER, SHARED_INDEX, SHARED_POSITION, SHARED_SLOT,
+    Hive, Cell, Bee, WorkQueue, SharedLayout, Telemetry, controls, move_point,
+    init, start_over, set_speed, update, run_headless, replay, save_snapshot, load_snapshot, run_simulation,
+)
+
+SPEEDS = [1, 10, 100]
 
 BLACK = (0, 0, 0)
 GRAY = (127, 127, 127)
@@ -24,23 +38,112 @@ BUILDER_BEE_COLOR = (255, 200, 100)
 CLEANER_BEE_COLOR = (120, 180, 255)
 FOOD_MAKER_BEE_COLOR = (100, 200, 150)
 
-pygame.init()
-
-display_info = pygame.display.Info()
-SCREEN_WIDTH = display_info.current_w
-SCREEN_HEIGHT = display_info.current_h
-CELL_SIZE = SCREEN_WIDTH / 40
-BEE_SIZE = SCREEN_HEIGHT / 30
-BEE_SPEED = 4
-QB_SPEED = 4
-
-SQRT3 = math.sqrt(3)
+# (border, background) per cell type, with unbuilt cells coloured by state
+CELL_COLORS = [
+    (BUILDER_BEE_COLOR, YELLOW_CELL1),
+    (YELLOW_BG, YELLOW_BG),
+    (BUILDER_BEE_COLOR, YELLOW_CELL1),
+    (NURSE_BEE_COLOR, YELLOW_CELL3),
+    (FOOD_MAKER_BEE_COLOR, YELLOW_CELL3),
+    (BUILDER_BEE_COLOR, YELLOW_CELL3),
+]
+UNBUILT_COLORS = {
+    BUILDING: (YELLOW_CELL2, YELLOW_CELL1),
+    BUILD_REQUESTED: (YELLOW_CELL1, YELLOW_CELL2),
+}
+
+BEE_COLORS = [GRAY, GRAY, NURSE_BEE_COLOR, CLEANER_BEE_COLOR, FOOD_MAKER_BEE_COLOR, BUILDER_BEE_COLOR, LIGHT_GRAY]
+BEE_SCALES = [1, 1.2, 1, 1, 1.2, 1.2, 1.2]
+
+# Queen bee keys
+QUEEN_KEYS = [(QB_UP, K_UP), (QB_DOWN, K_DOWN), (QB_LEFT, K_LEFT), (QB_RIGHT, K_RIGHT), (QB_LAY, K_RETURN)]
+
+np = None
+
+ZOOM_LEVELS = [0.125, 0.25, 0.5, 1, 2]
+
+FONT_NAME = "Verdana"
+FONT_CACHE = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "bee-game", "fonts.json")
+
+def find_font(name):
+    # pygame.font.match_font scans every installed font, so remember what it found
+    import json
+    try:
+        with open(FONT_CACHE) as f:
+            paths = json.load(f)
+    except (OSError, ValueError):
+        paths = {}
+    path = paths.get(name)
+    if name not in paths or (path is not None and not os.path.exists(path)):
+        # None means the font is not installed, and pygame's default font is used
+        path = pygame.font.match_font(name)
+        paths[name] = path
+        try:
+            os.makedirs(os.path.dirname(FONT_CACHE), exist_ok=True)
+            with open(FONT_CACHE, "w") as f:
+                json.dump(paths, f)
+        except OSError:
+            pass
+    return path
+
+def load_font(size):
+    if not pygame.font.get_init():
+        pygame.font.init()
+    return pygame.font.Font(ui.font_path, size)
+
+
+class UI(object):
+    # fonts and screen widgets, built the first time they are drawn, and where the mouse is over the hive
+    def __init__(self):
+        self.mouse_pos = (0, 0)
+
+    @cached_property
+    def font_path(self):
+        return find_font(FONT_NAME)
+
+    @cached_property
+    def font(self):
+        return load_font(60)
+
+    @cached_property
+    def font_medium(self):
+        return load_font(30)
+
+    @cached_property
+    def font_small(self):
+        return load_font(20)
+
+    @cached_property
+    def font_tiny(self):
+        return load_font(colony.SCREEN_WIDTH // 114)
+
+    @cached_property
+    def build_text(self):
+        return self.font.render("+", True, LIGHT_GRAY)
+
+    @cached_property
+    def start_over_button(self):
+        return Button(screen_anchor, "Start Over", NURSE_BEE_COLOR, 0, colony.SCREEN_HEIGHT / 2 + 40, start_over, self.font)
+
+    @cached_property
+    def pause_button(self):
+        return Button(screen_anchor, "Pause", NURSE_BEE_COLOR, colony.SCREEN_WIDTH / 2 - 50, 90, partial(controls.post, PAUSE), self.font_small)
+
+    @cached_property
+    def job_buttons(self):
+        # shown above the first bee waiting for a job, for the jobs it can take
+        return {
+            UNASSIGNED: [
+                Button(waiting_bee_anchor, "(N)urse", NURSE_BEE_COLOR, 0, 20, partial(controls.post, ASSIGN_JOB, NURSE)),
+                Button(waiting_bee_anchor, "(C)leaner", CLEANER_BEE_COLOR, 0, 50, partial(controls.post, ASSIGN_JOB, CLEANER)),
+            ],
+            UNASSIGNED2: [
+                Button(waiting_bee_anchor, "(F)ood Maker", FOOD_MAKER_BEE_COLOR, 0, 20, partial(controls.post, ASSIGN_JOB, FOOD_MAKER)),
+                Button(waiting_bee_anchor, "(B)uilder", YELLOW_BEE1, 0, 50, partial(controls.post, ASSIGN_JOB, BUILDER)),
+            ]
+        }
 
-font = pygame.font.SysFont("Verdana", 60)
-font_medium = pygame.font.SysFont("Verdana", 30)
-font_small = pygame.font.SysFont("Verdana", 20)
-font_tiny = pygame.font.SysFont("Verdana", SCREEN_WIDTH//114)
-build_text = font.render("+", True, LIGHT_GRAY)
+ui = UI()
 
 def hexagon(center, size):
     return [
@@ -52,148 +155,6 @@ def hexagon(center, size):
             (center[0] + SQRT3 * size, center[1] + size),
         ]
 
-def distance(a, b):
-    return math.sqrt((b[0] - a[0]) ** 2 + (b[1] - a[1]) ** 2)
-
-def move_point(p, dx, dy):
-    return (p[0] + dx, p[1] + dy)
-
-def random_in_rect(rect):
-    return (random.randint(rect.left, rect.right), random.randint(rect.top, rect.bottom))
-
-class Task(object):
-    def start(self, bee):
-        pass
-    def update(self):
-        pass
-    def is_done(self):
-        pass
-
-class TravelTo(Task):
-    def __init__(self, dest):
-        super().__init__()
-        self.dest = dest
-    
-    def start(self, bee):
-        self.bee = bee
-        dist = distance(bee.center, self.dest)
-        self.dx = (self.dest[0] - bee.center[0]) / dist * BEE_SPEED
-        self.dy = (self.dest[1] - bee.center[1]) / dist * BEE_SPEED
-
-    def update(self):
-        self.bee.center = move_point(self.bee.center, self.dx, self.dy)
-    
-    def is_done(self):
-        return distance(self.bee.center, self.dest) < 10
-
-class Build(Task):
-    def __init__(self, cell):
-        super().__init__()
-        self.cell = cell
-    def start(self, bee):
-        self.cell.state = "building"
-        self.time_remaining = FPS * 3
-    def update(self):
-        self.time_remaining -= 1
-        if self.time_remaining == 0:
-            self.cell.state = "ready"
-            self.cell.type = "built"
-            hive.enable_cells()
-
-    def is_done(self):
-        return self.time_remaining == 0
-
-class Nurse(Task):
-    def __init__(self, cell):
-        super().__init__()
-        self.cell = cell
-        self.total_time = FPS * 5
-        self.elapsed_time = 0
-    def start(self, bee):
-        self.cell.state = "nursing"
-        self.cell.progress = 0
-    def update(self):
-        self.elapsed_time += 1
-        self.cell.progress = self.elapsed_time / self.total_time
-        if self.elapsed_time == self.total_time:
-            self.cell.state = "cleaner requested"
-            hive.request_cleaner(self.cell)
-            self.cell.progress = 0
-            new_bee = Bee(self.cell.rect.center[0], self.cell.rect.center[1], "unassigned")
-            new_bee.add_tasks([
-                TravelTo(random_in_rect(job_rect)),
-                GetJob(),
-            ])
-            hive.add_bee(new_bee)
-    def is_done(self):
-        return self.elapsed_time == self.total_time
-
-class Clean(Task):
-    def __init__(self, cell):
-        super().__init__()
-        self.cell = cell
-        self.total_time = FPS * 4
-        self.elapsed_time = 0
-    def start(self, bee):
-        self.cell.state = "cleaning"
-        self.cell.progress = 0
-    def update(self):
-        self.elapsed_time += 1
-        if self.elapsed_time == self.total_time:
-            self.cell.state = self.cell.type
-    def is_done(self):
-        return self.elapsed_time == self.total_time
-
-class MakeFood(Task):
-    def __init__(self, cell):
-        super().__init__()
-        self.cell = cell
-        self.total_time = FPS * 5
-        self.elapsed_time = 0
-    def start(self, bee):
-        self.cell.state = "making food"
-        self.cell.progress = 0
-    def update(self):
-        self.elapsed_time += 1
-        self.cell.progress = self.elapsed_time / self.total_time
-        if self.elapsed_time == self.total_time:
-            if self.cell.type == "honey":
-                hive.honey = min(100, hive.honey + 4)
-            elif self.cell.type == "bee bread":
-                hive.bee_bread = min(20, hive.bee_bread + 1)
-            self.cell.state = "cleaner requested"
-            hive.request_cleaner(self.cell)
-            self.cell.progress = 0
-    def is_done(self):
-        return self.elapsed_time == self.total_time
-
-class Die(Task):
-    def __init__(self):
-        super().__init__()
-        self.total_time = FPS * 2
-        self.elapsed_time = 0
-    def start(self, bee):
-        self.bee = bee
-        bee.job = "dying"
-    def update(self):
-        self.elapsed_time += 1
-        if self.elapsed_time == self.total_time:
-            hive.remove_bee(self.bee)
-    def is_done(self):
-        return self.elapsed_time == self.total_time
-
-
-class GetJob(Task):
-    def __init__(self):
-        super().__init__()
-    def start(self, bee):
-        hive.bees_needing_jobs.append(bee)
-    def update(self):
-        pass
-    def is_done(self):
-        return True
-
-
 def center_text(surface, rect):
     w = surface.get_width()
     h = surface.get_height()
@@ -209,560 +170,949 @@ def center_text2(surface, rect):
     return move_point(rect.center, -w/2, 0)
 
 
+def render_button(text, color, font):
+    rendered_text = font.render(text, True, GRAY)
+    w = rendered_text.get_width() + colony.SCREEN_WIDTH // 100
+    h = rendered_text.get_height() + colony.SCREEN_WIDTH // 200
+    button_surface = pygame.Surface((w, h))
+    pygame.draw.rect(button_surface, color, button_surface.get_rect())
+    button_surface.blit(rendered_text, center_text(rendered_text, button_surface.get_rect()))
+    return button_surface
+
+button_surfaces = {}
+
+
 class Button(object):
-    def __init__(self, parent, text, color, x, y, fn, font = font_tiny):
-        self.parent = parent
+    __slots__ = ("anchor", "fn", "pos", "button_surface")
+
+    def __init__(self, anchor, text, color, x, y, fn, font = None):
+        self.anchor = anchor
         self.fn = fn
         self.pos = (x, y)
-        self.rendered_text = font.render(text, True, GRAY)
-        w = self.rendered_text.get_width() + SCREEN_WIDTH // 100
-        h = self.rendered_text.get_height() + SCREEN_WIDTH // 200
-        self.button_surface = pygame.Surface((w, h))
-        pygame.draw.rect(self.button_surface, color, self.button_surface.get_rect())
-        self.button_surface.blit(self.rendered_text, center_text(self.rendered_text, self.button_surface.get_rect()))
+        key = (text, color, font or ui.font_tiny)
+        self.button_surface = button_surfaces.get(key)
+        if self.button_surface is None:
+            self.button_surface = button_surfaces[key] = render_button(*key)
 
     def draw(self, surface):
         surface.blit(self.button_surface, self.get_rect().topleft)
 
     def get_rect(self):
         rect = self.button_surface.get_rect()
-        rect.midtop = move_point(self.parent.rect.midtop, self.pos[0], self.pos[1])
+        rect.midtop = move_point(self.anchor(), self.pos[0], self.pos[1])
         return rect
 
     def handle_click(self):
         self.fn()
 
 
-class Hive(object):
-    def __init__(self, bees = [], cells = []):
-        pass
-        self.honey = 20
-        self.bee_bread = 5
-        self.bees = bees
-        self.cells = cells
-        self.cells_needing_builder = []
-        self.cells_needing_food_maker = []
-        self.cells_needing_nurse = []
-        self.cells_needing_cleaner = []
-        self.bees_needing_jobs = []
-        self.debug = False
-        self.paused = False
-        self.next_id = 1
-        self.cell_dict = defaultdict(lambda: defaultdict(None))
-        self.rect = pygame.Rect(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)
-        for bee in bees:
-            self.assign_id(bee)
-        for cell in cells:
-            self.cell_dict[cell.row][cell.col] = cell
-
-    def get_cell(self, r, c):
-        if r in self.cell_dict:
-            if c in self.cell_dict[r]:
-                return self.cell_dict[r][c]
-        return None
-
-    def assign_id(self, bee):
-        bee.id = self.next_id
-        self.next_id += 1
-
-    def add_bee(self, bee):
-        self.assign_id(bee)
-        self.bees.append(bee)
-        self.bee_bread -= 1
-
-    def remove_bee(self, bee):
-        self.bees = [ b for b in self.bees if b.id != bee.id ]
-
-    def is_first_bee_waiting_for_job(self, bee):
-        return len(self.bees_needing_jobs) > 0 and bee.id == self.bees_needing_jobs[0].id
-
-    def assign_job(self, job):
-        if len(self.bees_needing_jobs) > 0:
-            bee = self.bees_needing_jobs[0]
-            if (bee.job == "unassigned" and job in ["nurse", "cleaner"]) or (bee.job == "unassigned2" and job in ["food maker", "builder"]):
-                bee.job = job
-                self.bees_needing_jobs = self.bees_needing_jobs[1:]
-
-    def request_job(self, bee):
-        if bee.job == "builder" and len(self.cells_needing_builder) > 0:
-            cell = self.cells_needing_builder[0]
-            self.cells_needing_builder = self.cells_needing_builder[1:]
-            self.assign_builder(cell, bee)
-        elif bee.job == "nurse" and len(self.cells_needing_nurse) > 0:
-            cell = self.cells_needing_nurse[0]
-            self.cells_needing_nurse = self.cells_needing_nurse[1:]
-            self.assign_nurse(cell, bee)
-        elif bee.job == "food maker" and len(self.cells_needing_food_maker) > 0:
-            cell = self.cells_needing_food_maker[0]
-            self.cells_needing_food_maker = self.cells_needing_food_maker[1:]
-            self.assign_food_maker(cell, bee)
-        elif bee.job == "cleaner" and len(self.cells_needing_cleaner) > 0:
-            cell = self.cells_needing_cleaner[0]
-            self.cells_needing_cleaner = self.cells_needing_cleaner[1:]
-            self.assign_cleaner(cell, bee)
-
-    def request_builder(self, cell):
-        cell.state = "build requested"
-        builder = self.get_bee("builder")
-        if builder is not None:
-            self.assign_builder(cell, builder)
-        else:
-            self.cells_needing_builder.append(cell)
-    
-    def assign_builder(self, cell, bee):
-        bee.add_tasks([
-            TravelTo(cell.rect.center),
-            Build(cell),
-        ])
-
-    def request_nurse(self, cell):
-        cell.state = "nurse requested"
-        nurse = self.get_bee("nurse")
-        if nurse is not None:
-            self.assign_nurse(cell, nurse)
-        else:
-            self.cells_needing_nurse.append(cell)
-    
-    def assign_nurse(self, cell, bee):
-        bee.add_tasks([
-            TravelTo(cell.rect.center),
-            Nurse(cell),
-        ])
-
-    def request_food_maker(self, cell):
-        cell.state = "food maker requested"
-        food_maker = self.get_bee("food maker")
-        if food_maker is not None:
-            self.assign_food_maker(cell, food_maker)
-        else:
-            self.cells_needing_food_maker.append(cell)
-
-    def assign_food_maker(self, cell, bee):
-        bee.add_tasks([
-            TravelTo(cell.rect.center),
-            MakeFood(cell),
-        ])
-
-    def request_cleaner(self, cell):
-        cell.state = "cleaner requested"
-        cleaner = self.get_bee("cleaner")
-        if cleaner is not None:
-            self.assign_cleaner(cell, cleaner)
+class SpriteCache(object):
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.sprites = OrderedDict()
+
+    def get(self, key, render):
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            sprite = render(*key)
+            self.sprites[key] = sprite
+            if len(self.sprites) > self.max_size:
+                self.sprites.popitem(last=False)
         else:
-            self.cells_needing_cleaner.append(cell)
-
-    def assign_cleaner(self, cell, bee):
-        bee.add_tasks([
-            TravelTo(cell.rect.center),
-            Clean(cell),
-        ])
-
-    def get_bee(self, job):
-        qualified_bees = [ bee for bee in self.bees if bee.job == job and not bee.is_busy() ]
-        if len(qualified_bees) > 0:
-            return qualified_bees[0]
-        return None
-
-    def enable_cells(self):
-        for cell in self.cells:
-            if cell.type == "none":
-                neighbors = [(-1, -1), (-1, 0), (0, 1), (1, 0), (1, -1), (0, -1), (-1, -1)]
-                for (r1, c1), (r2, c2) in itertools.pairwise(neighbors):
-                    a1 = 0 if r1 == 0 else cell.row % 2
-                    a2 = 0 if r2 == 0 else cell.row % 2
-                    n1 = self.get_cell(cell.row + r1, cell.col + c1 + a1)
-                    n2 = self.get_cell(cell.row + r2, cell.col + c2 + a2)
-                    if n1 is not None and n2 is not None:
-                        if n1.type not in ["none", "unbuilt"] and n2.type not in ["none", "unbuilt"]:
-                            cell.type = "unbuilt"
-                            cell.state = "unbuilt"
-                            break
+            self.sprites.move_to_end(key)
+        return sprite
+
+    def clear(self):
+        self.sprites.clear()
+
+
+def render_cell_sprite(typ, state, step, zoom):
+    progress = step / CELL_PROGRESS_STEPS
+    cell_size = colony.CELL_SIZE * zoom
+    if typ == UNBUILT:
+        border_color, bg_color = UNBUILT_COLORS.get(state, CELL_COLORS[UNBUILT])
+    else:
+        border_color, bg_color = CELL_COLORS[typ]
+    if state in DIRTY_STATES:
+        bg_color = LIGHT_GRAY
+
+    sprite = pygame.Surface((math.ceil(cell_size * SQRT3 * 2) + 4, math.ceil(cell_size * 4) + 4), pygame.SRCALPHA)
+    center = (sprite.get_width() // 2, sprite.get_height() // 2)
+    points = hexagon(center, cell_size)
+    pygame.draw.polygon(sprite, bg_color, points)
+    inner_points = hexagon(center, cell_size - 2 * zoom)
+    pygame.draw.polygon(sprite, border_color, inner_points, width=max(1, round(7 * zoom)))
+    pygame.draw.aalines(sprite, BLACK, closed=True, points=points)
+    if state in EGG_STATES:
+        pygame.draw.circle(sprite, WHITE, move_point(center, 0, cell_size), cell_size / 4 * (1 + progress))
+    if typ == BEE_BREAD and state == MAKING_FOOD:
+        size = cell_size / 4 * (1 + progress)
+        rect = pygame.Rect(0, 0, size, size)
+        rect.center = move_point(center, 0, cell_size)
+        pygame.draw.rect(sprite, FOOD_MAKER_BEE_COLOR, rect)
+    elif typ == HONEY and state == MAKING_FOOD:
+        size = cell_size / 8 * (1 + progress)
+        hex = hexagon(move_point(center, 0, cell_size), size)
+        pygame.draw.polygon(sprite, BUILDER_BEE_COLOR, hex)
+    return sprite
+
+cell_sprites = SpriteCache(256)
+
+
+def render_bee_sprite(color, scale, zoom):
+    size = colony.BEE_SIZE * scale * zoom
+    radius = math.ceil(size) + 1
+    sprite = pygame.Surface((radius * 2 + 1, radius * 2 + 1), pygame.SRCALPHA)
+    center = (radius, radius)
+    pygame.draw.circle(sprite, YELLOW_BEE1, center, size)
+    pygame.draw.circle(sprite, color, center, size / 2)
+    pygame.gfxdraw.aacircle(sprite, radius, radius, int(size), BLACK)
+    return sprite
+
+def sprite_position(sprite, center):
+    return (int(center[0]) - sprite.get_width() // 2, int(center[1]) - sprite.get_height() // 2)
+
+bee_sprites = SpriteCache(64)
+
+
+def draw_bees(surface, bees):
+    surface.blits([ bee_sprite_blit(bee) for bee in bees ], doreturn=False)
+    for bee in bees:
+        draw_bee_extras(surface, bee)
+
+
+def render_text(font, text, color):
+    return font.render(text, True, color)
+
+def cached_text(font, text, color):
+    return text_cache.get((font, text, color), render_text)
+
+text_cache = SpriteCache(256)
+
+
+class Camera(object):
+    def __init__(self):
+        self.offset = (0, 0)
+        self.zoom = 1
 
-    def draw(self, surface):
-        honey_text = font_small.render("Honey: %d/100" % self.honey, True, GRAY)
-        bee_bread_text = font_small.render("Bee bread: %d/20" % self.bee_bread, True, GRAY)
-        surface.blit(honey_text, (SCREEN_WIDTH - honey_text.get_width() - honey_text.get_height()/2, honey_text.get_height()/2))
-        surface.blit(bee_bread_text, (SCREEN_WIDTH - bee_bread_text.get_width() - bee_bread_text.get_height()/2, honey_text.get_height() + bee_bread_text.get_height()))
-        
-        total_bee_text = font_medium.render("Total bees", True, GRAY)
-        surface.blit(total_bee_text, ((SCREEN_WIDTH - total_bee_text.get_width()) / 2, 0))
-        bee_count_text = font.render(str(len(self.bees)), True, GRAY)
-        surface.blit(bee_count_text, ((SCREEN_WIDTH - bee_count_text.get_width()) / 2, total_bee_text.get_height()))
-
-        nurse_bee_text = font_small.render("Nurse bees", True, GRAY)
-        cleaner_bee_text = font_small.render("Cleaner bees", True, GRAY)
-        food_maker_bee_text = font_small.render("Food maker bees", True, GRAY)
-        builder_bee_text = font_small.render("Builder bees", True, GRAY)
-        surface.blit(nurse_bee_text, (SCREEN_WIDTH / 6 - nurse_bee_text.get_width() / 2, 0))
-        surface.blit(cleaner_bee_text, (SCREEN_WIDTH * 2 / 6 - cleaner_bee_text.get_width() / 2, 0))
-        surface.blit(food_maker_bee_text, (SCREEN_WIDTH * 4 / 6 - food_maker_bee_text.get_width() / 2, 0))
-        surface.blit(builder_bee_text, (SCREEN_WIDTH * 5 / 6 - builder_bee_text.get_width() / 2, 0))
-        
-        nurse_bee_count_text = font_medium.render(str(sum(1 for bee in self.bees if bee.job == "nurse")), True, NURSE_BEE_COLOR)
-        cleaner_bee_count_text = font_medium.render(str(sum(1 for bee in self.bees if bee.job == "cleaner")), True, CLEANER_BEE_COLOR)
-        food_maker_bee_count_text = font_medium.render(str(sum(1 for bee in self.bees if bee.job == "food maker")), True, FOOD_MAKER_BEE_COLOR)
-        builder_bee_count_text = font_medium.render(str(sum(1 for bee in self.bees if bee.job == "builder")), True, BUILDER_BEE_COLOR)
-        surface.blit(nurse_bee_count_text, (SCREEN_WIDTH / 6 - nurse_bee_count_text.get_width() / 2, nurse_bee_text.get_height()))
-        surface.blit(cleaner_bee_count_text, (SCREEN_WIDTH * 2 / 6 - cleaner_bee_count_text.get_width() / 2, cleaner_bee_text.get_height()))
-        surface.blit(food_maker_bee_count_text, (SCREEN_WIDTH * 4 / 6 - food_maker_bee_count_text.get_width() / 2, food_maker_bee_text.get_height()))
-        surface.blit(builder_bee_count_text, (SCREEN_WIDTH * 5 / 6 - builder_bee_count_text.get_width() / 2, builder_bee_text.get_height()))
-
-class Cell(pygame.sprite.Sprite):
-    def __init__(self, row, col, typ = "none"):
-        super().__init__()
-        self.row = row
-        self.col = col
-        y = SCREEN_HEIGHT / 2 + row * CELL_SIZE * 3 
-        x = SCREEN_WIDTH / 2 + (col * 2 + row % 2) * CELL_SIZE * SQRT3
-        self.rect = pygame.Rect(0, 0, CELL_SIZE * SQRT3 * 2, CELL_SIZE * 2)
-        self.rect.center = (x, y)
-        self.type = typ
-        self.state = typ
-        self.progress = 0
-        self.buttons = [
-            Button(self, "Nursery", NURSE_BEE_COLOR, 0, 0, self.make_nursery),
-            Button(self, "Bee bread", FOOD_MAKER_BEE_COLOR, 0, SCREEN_HEIGHT // 38, self.request_bee_bread),
-            Button(self, "Honey", BUILDER_BEE_COLOR, 0, SCREEN_HEIGHT // 19, self.request_honey),
-        ]
- 
-    def update(self):
-        if self.type == "bee bread" and self.state == "bee bread":
-            hive.request_food_maker(self)
-        if self.type == "honey" and self.state == "honey":
-            hive.request_food_maker(self)
-
-    def make_nursery(self):
-        self.type = "nursery"
-        self.state = "nursery"
- 
-    def request_honey(self):
-        self.type = "honey"
-        hive.request_food_maker(self)
-
-    def request_bee_bread(self):
-        self.type = "bee bread"
-        hive.request_food_maker(self)
+    def to_screen(self, point):
+        return ((point[0] - self.offset[0]) * self.zoom, (point[1] - self.offset[1]) * self.zoom)
 
-    def draw(self, surface):
-        if hive.debug:
-            rc_text = font_small.render("%d, %d" % (self.row, self.col), True, GRAY)
-            surface.blit(rc_text, self.rect.center)
-        if self.type == "none":
-            return
-        if self.type == "unbuilt":
-            if self.state == "building":
-                border_color = YELLOW_CELL2
-                bg_color = YELLOW_CELL1
-            elif self.state == "build requested":
-                border_color = YELLOW_CELL1
-                bg_color = YELLOW_CELL2
-            else:
-                border_color = YELLOW_BG
-                bg_color = YELLOW_BG
-        elif self.type == "nursery":
-            border_color = NURSE_BEE_COLOR
-            bg_color = YELLOW_CELL3
-        elif self.type == "bee bread":
-            border_color = FOOD_MAKER_BEE_COLOR
-            bg_color = YELLOW_CELL3
-        elif self.type == "honey":
-            border_color = BUILDER_BEE_COLOR
-            bg_color = YELLOW_CELL3
-        else:
-            border_color = BUILDER_BEE_COLOR
-            bg_color = YELLOW_CELL1
-        if self.state == "cleaner requested" or self.state == "cleaning":
-            bg_color = LIGHT_GRAY
-
-        points = hexagon(self.rect.center, CELL_SIZE)
-        pygame.draw.polygon(surface, bg_color, points)
-        inner_points = hexagon(self.rect.center, CELL_SIZE-2)
-        pygame.draw.polygon(surface, border_color, inner_points, width=7)
-        pygame.draw.aalines(surface, BLACK, closed=True, points=points)
-        if self.type == "unbuilt":
-            if self.state == "unbuilt" and self.rect.collidepoint(pygame.mouse.get_pos()):
-                surface.blit(build_text, center_text(build_text, self.rect))
-        elif self.state == "ready" and self.rect.collidepoint(pygame.mouse.get_pos()):
-            for button in self.buttons:
-                button.draw(surface)
-        if self.state in ["nursery with egg", "nurse requested", "nursing"]:
-            pygame.draw.circle(surface, WHITE, move_point(self.rect.center, 0, CELL_SIZE), CELL_SIZE / 4 * (1 + self.progress))
-        if self.type == "bee bread" and self.state == "making food":
-            size = CELL_SIZE / 4 * (1 + self.progress)
-            rect = pygame.Rect(0, 0, size, size)
-            rect.center = move_point(self.rect.center, 0, CELL_SIZE)
-            pygame.draw.rect(surface, FOOD_MAKER_BEE_COLOR, rect)
-        elif self.type == "honey" and self.state == "making food":
-            size = CELL_SIZE / 8 * (1 + self.progress)
-            hex = hexagon(move_point(self.rect.center, 0, CELL_SIZE), size)
-            pygame.draw.polygon(surface, BUILDER_BEE_COLOR, hex)
-        if hive.debug:
-            pygame.draw.rect(surface, BLACK, self.rect, 1)
+    def to_world(self, point):
+        return (point[0] / self.zoom + self.offset[0], point[1] / self.zoom + self.offset[1])
 
-    def handle_click(self):
-        if self.state == "unbuilt":
-            hive.request_builder(self)
-        elif self.state == "ready":
-            for button in self.buttons:
-                if button.get_rect().collidepoint(pygame.mouse.get_pos()):
-                    button.handle_click()
-
-
-class Bee(pygame.sprite.Sprite):
-    def __init__(self, x, y, job):
-        super().__init__()
-        self.rect = pygame.Rect(0, 0, BEE_SIZE, BEE_SIZE)
-        self.center = (x, y)
-        self.job = job
-        self.tasks = []
-        self.task = None
-        self.is_idle = True
-        self.buttons = {
-            "unassigned": [
-                Button(self, "(N)urse", NURSE_BEE_COLOR, 0, 20, self.make_nurse),
-                Button(self, "(C)leaner", CLEANER_BEE_COLOR, 0, 50, self.make_cleaner),
-            ],
-            "unassigned2": [
-                Button(self, "(F)ood Maker", FOOD_MAKER_BEE_COLOR, 0, 20, self.make_food_maker),
-                Button(self, "(B)uilder", YELLOW_BEE1, 0, 50, self.make_builder),
-            ]
-        }
-        self.time_since_last_meal = 0
-        self.meals = 0
+    def rect_to_screen(self, rect):
+        left, top = self.to_screen(rect.topleft)
+        return pygame.Rect(left, top, math.ceil(rect.width * self.zoom), math.ceil(rect.height * self.zoom))
 
-    def make_nurse(self):
-        self.job = "nurse"
-    
-    def make_cleaner(self):
-        self.job = "cleaner"
-
-    def make_food_maker(self):
-        self.job = "food_maker"
-
-    def make_builder(self):
-        self.job = "builder"
-
-    def update(self):
-        self.time_since_last_meal += 1
-        if self.time_since_last_meal > 20 * FPS:
-            hive.honey -= 1
-            self.meals += 1
-            self.time_since_last_meal = 0
-
-        if self.task is None or self.task.is_done():
-            if self.meals == 3 and self.job in ["nurse", "cleaner"]:
-                self.job = "unassigned2"
-                self.add_tasks([
-                    TravelTo(random_in_rect(job_rect)),
-                    GetJob(),
-                ])
-            elif self.meals == 6:
-                self.add_tasks([
-                    TravelTo(random_in_rect(die_rect)),
-                    Die(),
-                ])
-
-            if len(self.tasks) == 0:
-                if self.job in ["unassigned", "unassigned2"]:
-                    self.task = None
-                    self.is_idle = True
-                else:
-                    hive.request_job(self)
-                    if len(self.tasks) == 0:
-                        self.task = TravelTo(random_in_rect(idle_rect))
-                        self.task.start(self)
-                        self.is_idle = True
-            else:
-                self.task = self.tasks[0]
-                self.tasks = self.tasks[1:]
-                self.task.start(self)
-        else:
-            self.task.update()
+    def rect_to_world(self, rect):
+        left, top = self.to_world(rect.topleft)
+        return pygame.Rect(left, top, math.ceil(rect.width / self.zoom), math.ceil(rect.height / self.zoom))
 
-    def add_task(self, task):
-        self.is_idle = False
-        self.tasks.append(task)
-    
-    def add_tasks(self, tasks):
-        self.is_idle = False
-        for task in tasks:
-            self.tasks.append(task)
+    def view_rect(self):
+        return self.rect_to_world(pygame.Rect(0, 0, colony.SCREEN_WIDTH, colony.SCREEN_HEIGHT))
+
+    def get_state(self):
+        return (self.offset, self.zoom)
+
+    def pan(self, dx, dy):
+        self.move_to((self.offset[0] - dx / self.zoom, self.offset[1] - dy / self.zoom))
+
+    def zoom_at(self, point, steps):
+        i = min(max(ZOOM_LEVELS.index(self.zoom) + steps, 0), len(ZOOM_LEVELS) - 1)
+        x, y = self.to_world(point)
+        self.zoom = ZOOM_LEVELS[i]
+        self.move_to((x - point[0] / self.zoom, y - point[1] / self.zoom))
+
+    def move_to(self, offset):
+        # keep the middle of the screen over the hive
+        bounds = colony.hive.bounds
+        half_width = colony.SCREEN_WIDTH / 2 / self.zoom
+        half_height = colony.SCREEN_HEIGHT / 2 / self.zoom
+        x = min(max(offset[0] + half_width, bounds.left), bounds.right)
+        y = min(max(offset[1] + half_height, bounds.top), bounds.bottom)
+        self.offset = (x - half_width, y - half_height)
+
+    def reset(self):
+        self.offset = (0, 0)
+        self.zoom = 1
+
+camera = Camera()
+
+
+def screen_anchor():
+    return (colony.SCREEN_WIDTH // 2, 0)
+
+def draw_hud(surface, hive):
+    honey_text = cached_text(ui.font_small, "Honey: %d/100" % hive.honey, GRAY)
+    bee_bread_text = cached_text(ui.font_small, "Bee bread: %d/20" % hive.bee_bread, GRAY)
+    surface.blit(honey_text, (colony.SCREEN_WIDTH - honey_text.get_width() - honey_text.get_height()/2, honey_text.get_height()/2))
+    surface.blit(bee_bread_text, (colony.SCREEN_WIDTH - bee_bread_text.get_width() - bee_bread_text.get_height()/2, honey_text.get_height() + bee_bread_text.get_height()))
     
-    def is_busy(self):
-        return not self.is_idle
+    total_bee_text = cached_text(ui.font_medium, "Total bees", GRAY)
+    surface.blit(total_bee_text, ((colony.SCREEN_WIDTH - total_bee_text.get_width()) / 2, 0))
+    bee_count_text = cached_text(ui.font, str(sum(hive.job_counts)), GRAY)
+    surface.blit(bee_count_text, ((colony.SCREEN_WIDTH - bee_count_text.get_width()) / 2, total_bee_text.get_height()))
+    if hive.speed != 1:
+        speed_text = cached_text(ui.font_small, "x%d" % hive.speed, GRAY)
+        surface.blit(speed_text, ((colony.SCREEN_WIDTH - speed_text.get_width()) / 2, total_bee_text.get_height() + bee_count_text.get_height()))
+
+    nurse_bee_text = cached_text(ui.font_small, "Nurse bees", GRAY)
+    cleaner_bee_text = cached_text(ui.font_small, "Cleaner bees", GRAY)
+    food_maker_bee_text = cached_text(ui.font_small, "Food maker bees", GRAY)
+    builder_bee_text = cached_text(ui.font_small, "Builder bees", GRAY)
+    surface.blit(nurse_bee_text, (colony.SCREEN_WIDTH / 6 - nurse_bee_text.get_width() / 2, 0))
+    surface.blit(cleaner_bee_text, (colony.SCREEN_WIDTH * 2 / 6 - cleaner_bee_text.get_width() / 2, 0))
+    surface.blit(food_maker_bee_text, (colony.SCREEN_WIDTH * 4 / 6 - food_maker_bee_text.get_width() / 2, 0))
+    surface.blit(builder_bee_text, (colony.SCREEN_WIDTH * 5 / 6 - builder_bee_text.get_width() / 2, 0))
     
-    def handle_click(self):
-        if self.job in ["unassigned", "unassigned2"]:
-            for button in self.buttons:
-                if button.get_rect().collidepoint(pygame.mouse.get_pos()):
-                    button.handle_click()
+    nurse_bee_count_text = cached_text(ui.font_medium, str(hive.job_counts[NURSE]), NURSE_BEE_COLOR)
+    cleaner_bee_count_text = cached_text(ui.font_medium, str(hive.job_counts[CLEANER]), CLEANER_BEE_COLOR)
+    food_maker_bee_count_text = cached_text(ui.font_medium, str(hive.job_counts[FOOD_MAKER]), FOOD_MAKER_BEE_COLOR)
+    builder_bee_count_text = cached_text(ui.font_medium, str(hive.job_counts[BUILDER]), BUILDER_BEE_COLOR)
+    surface.blit(nurse_bee_count_text, (colony.SCREEN_WIDTH / 6 - nurse_bee_count_text.get_width() / 2, nurse_bee_text.get_height()))
+    surface.blit(cleaner_bee_count_text, (colony.SCREEN_WIDTH * 2 / 6 - cleaner_bee_count_text.get_width() / 2, cleaner_bee_text.get_height()))
+    surface.blit(food_maker_bee_count_text, (colony.SCREEN_WIDTH * 4 / 6 - food_maker_bee_count_text.get_width() / 2, food_maker_bee_text.get_height()))
+    surface.blit(builder_bee_count_text, (colony.SCREEN_WIDTH * 5 / 6 - builder_bee_count_text.get_width() / 2, builder_bee_text.get_height()))
+
+
+def cell_button_anchor(cell):
+    return camera.to_screen(cell.rect.midtop)
+
+def cell_buttons(cell):
+    # only the ready cell under the mouse shows these, so they are made when it is drawn or clicked
+    anchor = partial(cell_button_anchor, cell)
+    return [
+        Button(anchor, "Nursery", NURSE_BEE_COLOR, 0, 0, partial(controls.post, MAKE_NURSERY, cell.row, cell.col)),
+        Button(anchor, "Bee bread", FOOD_MAKER_BEE_COLOR, 0, colony.SCREEN_HEIGHT // 38, partial(controls.post, MAKE_BEE_BREAD, cell.row, cell.col)),
+        Button(anchor, "Honey", BUILDER_BEE_COLOR, 0, colony.SCREEN_HEIGHT // 19, partial(controls.post, MAKE_HONEY, cell.row, cell.col)),
+    ]
+
+def draw_cell(surface, cell):
+    center = camera.to_screen(cell.rect.center)
+    if colony.hive.debug:
+        rc_text = ui.font_small.render("%d, %d" % (cell.row, cell.col), True, GRAY)
+        surface.blit(rc_text, center)
+    if cell.type == EMPTY:
+        return
+    sprite = cell_sprites.get(cell.sprite_key() + (camera.zoom,), render_cell_sprite)
+    surface.blit(sprite, move_point(center, -(sprite.get_width() // 2), -(sprite.get_height() // 2)))
+    if cell.type == UNBUILT:
+        if cell.state == UNBUILT and cell.rect.collidepoint(ui.mouse_pos):
+            surface.blit(ui.build_text, center_text(ui.build_text, camera.rect_to_screen(cell.rect)))
+    elif cell.state == READY and cell.rect.collidepoint(ui.mouse_pos):
+        for button in cell_buttons(cell):
+            button.draw(surface)
+    if colony.hive.debug:
+        draw_outline(surface, camera.rect_to_screen(cell.rect))
+
+def cell_draw_rect(cell):
+    rect = pygame.Rect(0, 0, colony.CELL_SIZE * SQRT3 * 2 * camera.zoom + 4, colony.CELL_SIZE * 4 * camera.zoom + 4)
+    rect.center = camera.to_screen(cell.rect.center)
+    return rect
+
+def click_cell(cell, pos):
+    if cell.state == UNBUILT:
+        controls.post(BUILD_CELL, cell.row, cell.col)
+    elif cell.state == READY:
+        for button in cell_buttons(cell):
+            if button.get_rect().collidepoint(pos):
+                button.handle_click()
+
+
+def waiting_bee_anchor():
+    bee = colony.hive.bees_needing_jobs.peek()
+    return camera.to_screen((bee.center[0], bee.center[1] - colony.BEE_SIZE * 4))
+
+def is_choosing_job(bee):
+    return bee.job in UNASSIGNED_JOBS and colony.hive.is_first_bee_waiting_for_job(bee)
+
+def click_waiting_bee(pos):
+    # only the first bee waiting for a job shows buttons, and they are laid out in screen pixels
+    bee = colony.hive.bees_needing_jobs.peek()
+    if bee is not None and bee.job in UNASSIGNED_JOBS:
+        for button in ui.job_buttons[bee.job]:
+            if button.get_rect().collidepoint(pos):
+                button.handle_click()
+
+def bee_sprite_blit(bee):
+    sprite = bee_sprites.get((BEE_COLORS[bee.job], BEE_SCALES[bee.job], camera.zoom), render_bee_sprite)
+    return (sprite, sprite_position(sprite, camera.to_screen(bee.center)))
+
+def draw_bee_extras(surface, bee):
+    if colony.hive.debug:
+        id_text = ui.font_small.render(str(bee.id), True, BLACK)
+        surface.blit(id_text, camera.to_screen(bee.center))
+    if is_choosing_job(bee):
+        for button in ui.job_buttons[bee.job]:
+            button.draw(surface)
+
+def bee_draw_state(bee):
+    size = colony.BEE_SIZE * 1.2 * camera.zoom + 2
+    rect = pygame.Rect(0, 0, size * 2, size * 2)
+    rect.center = camera.to_screen(bee.center)
+    is_first = is_choosing_job(bee)
+    if is_first:
+        rect = rect.unionall([ button.get_rect() for button in ui.job_buttons[bee.job] ])
+    return (rect, bee.job, is_first)
+
+
+def draw_queen(surface, queen):
+    sprite = bee_sprites.get((BLACK, 1.5, camera.zoom), render_bee_sprite)
+    surface.blit(sprite, sprite_position(sprite, camera.to_screen(queen.center)))
+
+def queen_draw_rect(queen):
+    size = colony.BEE_SIZE * 1.5 * camera.zoom + 2
+    rect = pygame.Rect(0, 0, size * 2, size * 2)
+    rect.center = camera.to_screen(queen.center)
+    return rect
+
+def held_keys(pressed):
+    held = 0
+    for flag, key in QUEEN_KEYS:
+        if pressed[key]:
+            held |= flag
+    return held
+
+def draw_background(surface):
+    surface.fill(YELLOW_BG)
+    pygame.draw.circle(surface, BUILDER_BEE_COLOR, camera.to_screen((0, colony.SCREEN_HEIGHT)), colony.SCREEN_HEIGHT / 2 * camera.zoom)
+
+def draw_outline(surface, rect):
+    # pygame.draw.rect outlines the clipped rect, which would leave stray edges along dirty regions
+    right, bottom = rect.right - 1, rect.bottom - 1
+    pygame.draw.lines(surface, BLACK, True, [rect.topleft, (right, rect.top), (right, bottom), (rect.left, bottom)])
+
+def draw_debug_rects(surface):
+    if colony.hive.debug:
+        draw_outline(surface, camera.rect_to_screen(colony.job_rect))
+        draw_outline(surface, camera.rect_to_screen(colony.die_rect))
+
+def draw_overlays(surface, game_over):
+    draw_hud(surface, colony.hive)
+    ui.pause_button.draw(surface)
+    if game_over:
+        game_over_text = cached_text(ui.font, "COLONY COLLAPSE", BLACK)
+        surface.blit(game_over_text, (colony.SCREEN_WIDTH / 2 - game_over_text.get_width() / 2, colony.SCREEN_HEIGHT / 2 - game_over_text.get_height() / 2))
+        ui.start_over_button.draw(surface)
+
+def draw_scene(surface, game_over, profiler = None):
+    t = time.perf_counter()
+    draw_background(surface)
+    draw_debug_rects(surface)
+    view = camera.view_rect()
+    for c in colony.hive.cells_in_rect(view):
+        draw_cell(surface, c)
+    if profiler is not None:
+        t = profiler.lap("draw cells", t)
+    draw_bees(surface, colony.hive.bees_in_rect(view))
+    draw_queen(surface, colony.qb)
+    if profiler is not None:
+        t = profiler.lap("draw bees", t)
+    draw_overlays(surface, game_over)
+    if profiler is not None:
+        profiler.lap("draw hud", t)
+
+
+class DirtyRenderer(object):
+    MAX_DIRTY_RECTS = 64
+
+    def __init__(self):
+        self.scene = None
+        self.cells = {}
+        self.bees = {}
+        self.queen = None
+        self.hud = None
+
+    def cell_state(self, cell, hovered):
+        rect = cell_draw_rect(cell)
+        if cell is hovered and cell.state == READY:
+            rect = rect.unionall([ button.get_rect() for button in cell_buttons(cell) ])
+        return (cell.sprite_key(), cell is hovered, rect)
+
+    def hud_state(self):
+        return (self.hive_counts(), colony.hive.honey, colony.hive.bee_bread, colony.hive.speed)
+
+    def hive_counts(self):
+        return tuple(colony.hive.job_counts[job] for job in WORKER_JOBS) + (len(colony.hive.bees),)
+
+    def draw(self, surface, game_over):
+        hovered = colony.hive.cell_at(ui.mouse_pos)
+        view = camera.view_rect()
+        cells = { cell: self.cell_state(cell, hovered) for cell in colony.hive.cells_in_rect(view) }
+        bees = { bee.id: bee_draw_state(bee) for bee in colony.hive.bees_in_rect(view) }
+        queen = queen_draw_rect(colony.qb)
+        hud = self.hud_state()
+
+        scene = (colony.hive, game_over, colony.hive.debug, camera.get_state())
+        full_redraw = scene != self.scene
+        dirty = []
+        if not full_redraw:
+            for cell, state in cells.items():
+                old_state = self.cells.get(cell)
+                if state != old_state:
+                    dirty.append(state[2])
+                    if old_state is not None:
+                        dirty.append(old_state[2])
+            for cell, state in self.cells.items():
+                if cell not in cells:
+                    dirty.append(state[2])
+            for id, state in bees.items():
+                old_state = self.bees.get(id)
+                if state != old_state:
+                    dirty.append(state[0])
+                    if old_state is not None:
+                        dirty.append(old_state[0])
+            for id, state in self.bees.items():
+                if id not in bees:
+                    dirty.append(state[0])
+            if queen != self.queen:
+                dirty.append(queen)
+                dirty.append(self.queen)
+            if hud != self.hud:
+                dirty.append(pygame.Rect(0, 0, colony.SCREEN_WIDTH, ui.font_medium.get_height() + ui.font.get_height() + ui.font_small.get_height()))
+            full_redraw = len(dirty) > self.MAX_DIRTY_RECTS
+
+        self.scene = scene
+        self.cells = cells
+        self.bees = bees
+        self.queen = queen
+        self.hud = hud
+
+        if full_redraw:
+            draw_scene(surface, game_over)
+            return [surface.get_rect()]
+        dirty = self.merge(dirty)
+        for rect in dirty:
+            self.draw_region(surface, rect, game_over, hovered)
+        return dirty
+
+    def merge(self, rects):
+        screen = pygame.Rect(0, 0, colony.SCREEN_WIDTH, colony.SCREEN_HEIGHT)
+        merged = []
+        for rect in rects:
+            rect = rect.clip(screen)
+            i = rect.collidelist(merged)
+            while i != -1:
+                rect.union_ip(merged.pop(i))
+                i = rect.collidelist(merged)
+            if rect.width > 0 and rect.height > 0:
+                merged.append(rect)
+        return merged
+
+    def draw_region(self, surface, rect, game_over, hovered):
+        surface.set_clip(rect)
+        draw_background(surface)
+        draw_debug_rects(surface)
+        area = camera.rect_to_world(rect)
+        cells = colony.hive.cells_in_rect(area)
+        if hovered in self.cells and hovered not in cells and self.cells[hovered][2].colliderect(rect):
+            cells.append(hovered)
+            cells.sort(key=lambda cell: (cell.row, cell.col))
+        for c in cells:
+            draw_cell(surface, c)
+        draw_bees(surface, [ bee for bee in colony.hive.bees_in_rect(area) if bee.id in self.bees and self.bees[bee.id][0].colliderect(rect) ])
+        if self.queen.colliderect(rect):
+            draw_queen(surface, colony.qb)
+        draw_overlays(surface, game_over)
+        surface.set_clip(None)
+
+
+class FrameProfiler(object):
+    PHASES = ["input", "move", "events", "queen", "sync", "draw cells", "draw bees", "draw hud", "dirty draw", "display"]
+    PERCENTILES = [50, 95, 99]
+    WINDOW = 300
+    # frames between re-renders of the overlay's numbers
+    REFRESH = FPS // 4
+
+    def __init__(self, keep_trace = False):
+        self.times = dict.fromkeys(self.PHASES, 0.0)
+        self.history = deque(maxlen=self.WINDOW)
+        self.trace = [] if keep_trace else None
+        self.visible = False
+        self.frame = 0
+        self.frame_start = time.perf_counter()
+        self.task_starts = colony.hive.task_starts
+        self.hive = colony.hive
+        self.panel = None
+        self.panel_frame = 0
+
+    def lap(self, phase, start):
+        now = time.perf_counter()
+        self.times[phase] += now - start
+        return now
+
+    def end_frame(self, ticks):
+        now = time.perf_counter()
+        if colony.hive is not self.hive:
+            self.hive = colony.hive
+            self.task_starts = colony.hive.task_starts
+        row = { "frame": self.frame, "tick": colony.hive.tick, "ticks": ticks, "frame ms": (now - self.frame_start) * 1000 }
+        for phase in self.PHASES:
+            row[phase] = self.times[phase] * 1000
+            self.times[phase] = 0.0
+        row["busy ms"] = sum(row[phase] for phase in self.PHASES)
+        row["task starts"] = colony.hive.task_starts - self.task_starts
+        row["bees"] = len(colony.hive.bees)
+        row["travellers"] = len(colony.hive.travellers)
+        row["scheduled"] = colony.hive.scheduled
+        row["builder queue"] = len(colony.hive.cells_needing_builder)
+        row["nurse queue"] = len(colony.hive.cells_needing_nurse)
+        row["food maker queue"] = len(colony.hive.cells_needing_food_maker)
+        row["cleaner queue"] = len(colony.hive.cells_needing_cleaner)
+        row["job queue"] = len(colony.hive.bees_needing_jobs)
+        self.history.append(row)
+        if self.trace is not None:
+            self.trace.append(row)
+        self.task_starts = colony.hive.task_starts
+        self.frame += 1
+        self.frame_start = now
+
+    def percentiles(self, column):
+        values = sorted(row[column] for row in self.history)
+        if len(values) == 0:
+            return [0] * len(self.PERCENTILES)
+        return [ values[min(len(values) - 1, len(values) * p // 100)] for p in self.PERCENTILES ]
 
     def draw(self, surface):
-        size = BEE_SIZE
-        bee_color = GRAY
-        if self.job == "nurse":            
-            bee_color = NURSE_BEE_COLOR
-        elif self.job == "builder":
-            bee_color = BUILDER_BEE_COLOR
-            size *= 1.2
-        elif self.job == "cleaner":
-            bee_color = CLEANER_BEE_COLOR
-        elif self.job == "food maker":
-            bee_color = FOOD_MAKER_BEE_COLOR
-            size *= 1.2
-        elif self.job == "unassigned2":
-            size *= 1.2
-        elif self.job == "dying":
-            size *= 1.2
-            bee_color = LIGHT_GRAY
-
-        pygame.draw.circle(surface, YELLOW_BEE1, self.center, size)
-        pygame.draw.circle(surface, bee_color, self.center, size / 2)
-        pygame.gfxdraw.aacircle(surface, int(self.center[0]), int(self.center[1]), int(size), BLACK)
-        if hive.debug:
-            id_text = font_small.render(str(self.id), True, BLACK)
-            surface.blit(id_text, self.center)
-        if self.job in ["unassigned", "unassigned2"]:
-            self.rect = pygame.Rect(0, 0, BEE_SIZE * 2, BEE_SIZE * 4)
-            self.rect.midbottom = self.center
-            if hive.is_first_bee_waiting_for_job(self):
-                for button in self.buttons[self.job]:
-                    button.draw(surface)
-
-
-class QueenBee(pygame.sprite.Sprite):
-    def __init__(self, x, y):
-        super().__init__()
-        self.center = (x, y)
-
-    def update(self):
-        pressed_keys = pygame.key.get_pressed()
-        if pressed_keys[K_UP] and self.center[1] > 0:
-            self.center = move_point(self.center, 0, -QB_SPEED)
-        if pressed_keys[K_DOWN] and self.center[1] < SCREEN_HEIGHT:
-            self.center = move_point(self.center, 0, QB_SPEED)
-        if pressed_keys[K_LEFT] and self.center[0] > 0:
-            self.center = move_point(self.center, -QB_SPEED, 0)
-        if pressed_keys[K_RIGHT] and self.center[0] < SCREEN_WIDTH:
-            self.center = move_point(self.center, QB_SPEED, 0)
-        if pressed_keys[K_RETURN]:
-            for cell in hive.cells:
-                if cell.state == "nursery" and cell.rect.collidepoint(self.center):
-                    cell.state = "nursery with egg"
-                    hive.request_nurse(cell)
-                    break
-    
-    def draw(self, surface):
-        size = BEE_SIZE * 1.5
-        pygame.draw.circle(surface, YELLOW_BEE1, self.center, size)
-        pygame.draw.circle(surface, BLACK, self.center, size / 2)
-        pygame.gfxdraw.aacircle(surface, int(self.center[0]), int(self.center[1]), int(size), BLACK)
-
-
-hive = None
-def init():
-    global hive
-    cells = []
-    row_indexes = {
-        -3: range (-2, 3),
-        -2: range(-3, 5),
-        -1: range(-4, 5),
-        0: range(-3, 6),
-        1: range(-3, 5),
-        2: range(-2, 4),
-        3: range(-2, 3),
-    }
-    for r, cell_range in row_indexes.items():
-        for c in cell_range:
-            typ = "unbuilt" if (r == 0 and c == 0) or (r == 1 and c in [-1, 0]) else "none"
-            cells.append(Cell(r, c, typ))
-
-    hive = Hive(
-        cells = cells,
-        bees = [Bee(100, 100, "nurse"), Bee(200, 100, "builder"), Bee(300, 100, "cleaner"), Bee(400, 100, "food maker")]
-    )
-init()
-
-def pause():
-    hive.paused = not hive.paused
-
-qb = QueenBee(SCREEN_WIDTH - 200, 200)
-job_rect = pygame.Rect(50, SCREEN_HEIGHT * 2 / 3, SCREEN_HEIGHT / 3, SCREEN_HEIGHT / 3 - 50)
-die_rect = pygame.Rect(SCREEN_WIDTH * 3 / 4, SCREEN_HEIGHT * 2 / 3, SCREEN_HEIGHT / 3, SCREEN_HEIGHT / 3 - 50)
-idle_rect = pygame.Rect(100, 100, 400, 300)
-start_over_button = Button(hive, "Start Over", NURSE_BEE_COLOR, 0, SCREEN_HEIGHT / 2 + 40, init, font)
-pause_button = Button(hive, "Pause", NURSE_BEE_COLOR, SCREEN_WIDTH / 2 - 50, 90, pause, font_small)
-
-def main():
+        if self.panel is None or self.frame - self.panel_frame >= self.REFRESH:
+            self.panel = self.render_panel()
+            self.panel_frame = self.frame
+        rect = self.panel.get_rect(topleft=(10, colony.SCREEN_HEIGHT // 8))
+        surface.blit(self.panel, rect)
+        return rect
+
+    def render_panel(self):
+        rows = [["ms"] + [ "p%d" % p for p in self.PERCENTILES ]]
+        for column in self.PHASES + ["busy ms", "frame ms"]:
+            rows.append([column.replace(" ms", "")] + [ "%.2f" % ms for ms in self.percentiles(column) ])
+        if len(self.history) > 0:
+            row = self.history[-1]
+            for column in ["ticks", "task starts", "scheduled", "builder queue", "nurse queue", "food maker queue", "cleaner queue", "job queue"]:
+                rows.append([column, "", "", str(row[column])])
+        height = ui.font_small.get_linesize()
+        label_width = ui.font_small.size("food maker queue")[0]
+        value_width = ui.font_small.size("000.00")[0] + 10
+        panel = pygame.Surface((label_width + value_width * len(self.PERCENTILES) + 20, height * len(rows) + 20))
+        panel.fill(LIGHT_GRAY)
+        for i, row in enumerate(rows):
+            y = 10 + i * height
+            panel.blit(cached_text(ui.font_small, row[0], BLACK), (10, y))
+            for j, value in enumerate(row[1:]):
+                if value == "":
+                    continue
+                text = ui.font_small.render(value, True, BLACK)
+                panel.blit(text, (10 + label_width + value_width * (j + 1) - text.get_width(), y))
+        return panel
+
+    def export(self, path):
+        import csv
+        import json
+        rows = self.trace if self.trace is not None else list(self.history)
+        with open(path, "w", newline="") as f:
+            if path.endswith(".json"):
+                json.dump(rows, f)
+            elif len(rows) > 0:
+                writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+                writer.writeheader()
+                writer.writerows(rows)
+
+
+class SharedProgress(object):
+    __slots__ = ("progress",)
+
+    def __init__(self):
+        self.progress = 0
+
+    def get_progress(self):
+        return self.progress
+
+
+class SharedHiveView(object):
+    # Mirrors the published snapshot into a hive of bare cells, so the usual drawing and click code works on it
+    def __init__(self):
+        self.shm = None
+        self.layout = None
+        self.offset = None
+        self.cell_index = {}
+        self.bee_count = 0
+        self.waiting = None
+        self.collapsed = False
+
+    def attach(self, name, cell_count, bee_capacity, rows, cols):
+        from multiprocessing import shared_memory
+        try:
+            shm = shared_memory.SharedMemory(name, track=False)
+        except FileNotFoundError:
+            # already replaced by a newer block, whose message is on its way
+            return
+        self.close()
+        self.shm = shm
+        self.layout = SharedLayout(cell_count, bee_capacity)
+        rows, cols = array.array("i", rows), array.array("i", cols)
+        cells = [ Cell(row, col) for row, col in zip(rows, cols) ]
+        colony.hive = Hive(cells = cells)
+        self.cell_index = { cell: i for i, cell in enumerate(cells) }
+        self.waiting = None
+
+    def acquire(self):
+        if self.shm is None:
+            return False
+        buf = self.shm.buf
+        while True:
+            latest = SHARED_HEADER.unpack_from(buf, 0)[0]
+            if latest < 0:
+                return False
+            SHARED_INDEX.pack_into(buf, SHARED_INDEX.size, latest)
+            # the simulation may have moved on to our slot before it saw our claim; if so, take the newer one
+            if SHARED_HEADER.unpack_from(buf, 0)[0] == latest:
+                break
+        self.offset = self.layout.slot(latest)
+        values = SHARED_SLOT.unpack_from(buf, self.offset)
+        colony.hive.tick, colony.hive.honey, colony.hive.bee_bread = values[:3]
+        colony.hive.job_counts = list(values[3:10])
+        self.bee_count, waiting = values[10:12]
+        colony.qb.center = values[12:14]
+        colony.hive.paused, self.collapsed = values[14:16]
+        self.sync_waiting_bee(waiting)
+        return True
+
+    def release(self):
+        SHARED_INDEX.pack_into(self.shm.buf, SHARED_INDEX.size, -1)
+        self.offset = None
+
+    def close(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm = None
+
+    def sync_cell(self, cell):
+        buf = self.shm.buf
+        n = self.layout.cell_count
+        i = self.offset + self.layout.cells + self.cell_index[cell]
+        cell.type = buf[i]
+        cell.state = buf[i + n]
+        if cell.state in PROGRESS_STATES:
+            if cell.timer is None:
+                cell.timer = SharedProgress()
+            cell.timer.progress = buf[i + n * 2] / CELL_PROGRESS_STEPS
+
+    def sync_waiting_bee(self, index):
+        if index < 0:
+            if self.waiting is not None:
+                colony.hive.bees_needing_jobs.cancel(self.waiting)
+                self.waiting = None
+            return
+        buf = self.shm.buf
+        bee_id = SNAPSHOT_ID.unpack_from(buf, self.offset + self.layout.ids + index * 4)[0]
+        x, y = SHARED_POSITION.unpack_from(buf, self.offset + self.layout.positions + index * 8)
+        if self.waiting is None or self.waiting.id != bee_id:
+            colony.hive.bees_needing_jobs = WorkQueue()
+            self.waiting = Bee(x, y, UNASSIGNED)
+            self.waiting.id = bee_id
+            colony.hive.bees_needing_jobs.push(self.waiting)
+        self.waiting.center = (x, y)
+        self.waiting.job = buf[self.offset + self.layout.jobs + index]
+
+    def visible_bees(self, area):
+        n = self.bee_count
+        positions_start = self.offset + self.layout.positions
+        jobs_start = self.offset + self.layout.jobs
+        if np is not None:
+            if n == 0:
+                return []
+            positions = np.frombuffer(self.shm.buf, dtype=np.float32, count=n * 2, offset=positions_start).reshape(-1, 2)
+            jobs = np.frombuffer(self.shm.buf, dtype=np.uint8, count=n, offset=jobs_start)
+            x, y = positions[:, 0], positions[:, 1]
+            visible = np.flatnonzero((x >= area.left) & (x < area.right) & (y >= area.top) & (y < area.bottom))
+            return zip(positions[visible].tolist(), jobs[visible].tolist())
+        positions = self.shm.buf[positions_start:positions_start + n * 8].cast("f")
+        jobs = self.shm.buf[jobs_start:jobs_start + n]
+        bees = [ ((x, y), job) for x, y, job in zip(positions[0::2], positions[1::2], jobs) if area.collidepoint(x, y) ]
+        positions.release()
+        jobs.release()
+        return bees
+
+    def draw_bees(self, surface, rect):
+        sprites = [ bee_sprites.get((BEE_COLORS[job], BEE_SCALES[job], camera.zoom), render_bee_sprite) for job in range(len(JOB_NAMES)) ]
+        blits = []
+        for center, job in self.visible_bees(rect.inflate(colony.BEE_SIZE * 8, colony.BEE_SIZE * 12)):
+            sprite = sprites[job]
+            blits.append((sprite, sprite_position(sprite, camera.to_screen(center))))
+        surface.blits(blits, doreturn=False)
+        if self.waiting is not None:
+            draw_bee_extras(surface, self.waiting)
+
+
+def draw_shared_scene(surface, view):
+    draw_background(surface)
+    draw_debug_rects(surface)
+    rect = camera.view_rect()
+    for c in colony.hive.cells_in_rect(rect):
+        view.sync_cell(c)
+        draw_cell(surface, c)
+    view.draw_bees(surface, rect)
+    draw_queen(surface, colony.qb)
+    draw_overlays(surface, view.collapsed)
+
+def setup(replay = None, headless = False, use_numpy = False):
+    # the screen size the comb is laid out for, and the movement backend, settled before any hive is built;
+    # only the live game asks SDL for the screen size, so importing this module never starts it
+    if use_numpy:
+        colony.set_backend(True)
+    if replay is not None:
+        colony.set_screen_size(*colony.read_log_header(replay)[1:3])
+    elif not headless:
+        pygame.display.init()
+        display_info = pygame.display.Info()
+        colony.set_screen_size(display_info.current_w, display_info.current_h)
+
+def main(dirty_rects = False, record = None, profile = None, save = None):
     FramePerSec = pygame.time.Clock()
     pygame.display.set_caption("Bee Game")
 
-    surface = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    surface = pygame.display.set_mode((colony.SCREEN_WIDTH, colony.SCREEN_HEIGHT))
+    renderer = DirtyRenderer() if dirty_rects else None
+    profiler = FrameProfiler(keep_trace = profile is not None)
+    lag = 0
+    if record is not None:
+        controls.start_recording()
 
     while True:
-        game_over = hive.honey == 0 or hive.bee_bread == 0 or len(hive.bees) == 0
+        t = time.perf_counter()
+        game_over = colony.hive.is_collapsed()
+        ui.mouse_pos = camera.to_world(pygame.mouse.get_pos())
+        ticks = 0
 
         # Events
         for event in pygame.event.get():
             if event.type == QUIT:
+                if record is not None:
+                    controls.save(record)
+                if profile is not None:
+                    profiler.export(profile)
+                if colony.telemetry is not None:
+                    colony.telemetry.close()
+                if save is not None:
+                    save_snapshot(save)
                 pygame.quit()
                 sys.exit()
-            elif event.type == MOUSEBUTTONUP:
+            elif event.type == MOUSEBUTTONUP and event.button == BUTTON_LEFT:
                 if game_over:
-                    if start_over_button.get_rect().collidepoint(pygame.mouse.get_pos()):
-                        start_over_button.handle_click()
-                if pause_button.get_rect().collidepoint(pygame.mouse.get_pos()):
-                    pause_button.handle_click()
-                for cell in hive.cells:
-                    if cell.rect.collidepoint(pygame.mouse.get_pos()):
-                        cell.handle_click()
-                        break
+                    if ui.start_over_button.get_rect().collidepoint(event.pos):
+                        ui.start_over_button.handle_click()
+                if ui.pause_button.get_rect().collidepoint(event.pos):
+                    ui.pause_button.handle_click()
+                cell = colony.hive.cell_at(camera.to_world(event.pos))
+                if cell is not None:
+                    click_cell(cell, event.pos)
                 else:
-                    for bee in hive.bees:
-                        if bee.rect.collidepoint(pygame.mouse.get_pos()):
-                            bee.handle_click()
-                            break
+                    click_waiting_bee(event.pos)
+            elif event.type == MOUSEMOTION and (event.buttons[1] or event.buttons[2]):
+                camera.pan(*event.rel)
+            elif event.type == MOUSEWHEEL:
+                camera.zoom_at(pygame.mouse.get_pos(), event.y)
             elif event.type == KEYUP:
                 if event.key == K_n:
-                    hive.assign_job("nurse")
+                    controls.post(ASSIGN_JOB, NURSE)
                 elif event.key == K_c:
-                    hive.assign_job("cleaner")
+                    controls.post(ASSIGN_JOB, CLEANER)
                 elif event.key == K_f:
-                    hive.assign_job("food maker")
+                    controls.post(ASSIGN_JOB, FOOD_MAKER)
                 elif event.key == K_b:
-                    hive.assign_job("builder")
+                    controls.post(ASSIGN_JOB, BUILDER)
                 elif event.key == K_d:
-                    hive.debug = not hive.debug
+                    colony.hive.debug = not colony.hive.debug
+                elif event.key == K_r:
+                    renderer = DirtyRenderer() if renderer is None else None
+                elif event.key == K_p:
+                    profiler.visible = not profiler.visible
+                    if renderer is not None:
+                        renderer = DirtyRenderer()
+                elif event.key == K_HOME:
+                    camera.reset()
+                elif event.key in [K_1, K_2, K_3]:
+                    set_speed(SPEEDS[[K_1, K_2, K_3].index(event.key)])
+
+        t = profiler.lap("input", t)
 
         # Update
-        if not game_over and not hive.paused:
-            for bee in hive.bees:
-                bee.update()
-            for cell in hive.cells:
-                cell.update()
-            qb.update()
+        if not game_over and not colony.hive.paused:
+            lag = min(lag, MAX_TICKS_PER_FRAME)
+            controls.hold(held_keys(pygame.key.get_pressed()))
+            while lag >= 1:
+                lag -= 1
+                ticks += 1
+                update(profiler)
+                if colony.hive.is_collapsed():
+                    break
+        else:
+            lag = 0
 
         # Draw
-        surface.fill(YELLOW_BG)
-        pygame.draw.circle(surface, BUILDER_BEE_COLOR, (0, SCREEN_HEIGHT), SCREEN_HEIGHT / 2)
-        if hive.debug:
-            pygame.draw.rect(surface, BLACK, job_rect, 1)
-            pygame.draw.rect(surface, BLACK, die_rect, 1)
-        for c in hive.cells:
-            c.draw(surface)
-        for b in hive.bees:
-            b.draw(surface)
-        qb.draw(surface)
-        hive.draw(surface)
-        pause_button.draw(surface)
-        
-        if game_over:
-            game_over_text = font.render("COLONY COLLAPSE", True, BLACK)
-            surface.blit(game_over_text, (SCREEN_WIDTH / 2 - game_over_text.get_width() / 2, SCREEN_HEIGHT / 2 - game_over_text.get_height() / 2))
-            start_over_button.draw(surface)
-
-        pygame.display.update()
+        t = time.perf_counter()
+        colony.hive.sync_positions()
+        t = profiler.lap("sync", t)
+        if renderer is not None:
+            rects = renderer.draw(surface, game_over)
+            profiler.lap("dirty draw", t)
+            if profiler.visible:
+                rects.append(profiler.draw(surface))
+            t = time.perf_counter()
+            pygame.display.update(rects)
+        else:
+            draw_scene(surface, game_over, profiler)
+            if profiler.visible:
+                profiler.draw(surface)
+            t = time.perf_counter()
+            pygame.display.update()
+        profiler.lap("display", t)
+        profiler.end_frame(ticks)
+        lag += FramePerSec.tick(FPS) * FPS / 1000 * colony.hive.speed
+
+def main_headless(ticks):
+    start = time.perf_counter()
+    ticks_run = run_headless(ticks)
+    elapsed = time.perf_counter() - start
+    print("%d ticks in %.2fs (%.0f ticks/s)" % (ticks_run, elapsed, ticks_run / max(elapsed, 1e-9)))
+    print_summary()
+
+def main_replay(path):
+    start = time.perf_counter()
+    replay(path)
+    elapsed = time.perf_counter() - start
+    print("replayed %s to tick %d in %.2fs" % (path, colony.hive.tick, elapsed))
+    print_summary()
+
+def main_split(seed, comb_radius, load, record, save, telemetry_path):
+    # the hive steps in its own process; this one only draws its snapshots and sends the player's commands back
+    import multiprocessing
+    global np
+    # culling the published bees is vectorised whenever NumPy is around, whichever backend the simulation uses
+    try:
+        import numpy as np
+    except ImportError:
+        pass
+    context = multiprocessing.get_context("spawn")
+    conn, child_conn = context.Pipe()
+    screen_size = (colony.SCREEN_WIDTH, colony.SCREEN_HEIGHT)
+    process = context.Process(target=run_simulation, args=(child_conn, screen_size, colony.USE_NUMPY, seed, comb_radius, load, record, save, telemetry_path), daemon=True)
+    process.start()
+    child_conn.close()
+    controls.remote = conn
+    view = SharedHiveView()
+
+    FramePerSec = pygame.time.Clock()
+    pygame.display.set_caption("Bee Game")
+    surface = pygame.display.set_mode((colony.SCREEN_WIDTH, colony.SCREEN_HEIGHT))
+
+    while True:
+        while conn.poll():
+            message = conn.recv()
+            if message[0] == "buffer":
+                view.attach(*message[1:])
+        if not process.is_alive():
+            pygame.quit()
+            sys.exit("the simulation process exited")
+        ready = view.acquire()
+        ui.mouse_pos = camera.to_world(pygame.mouse.get_pos())
+
+        for event in pygame.event.get():
+            if event.type == QUIT:
+                if ready:
+                    view.release()
+                view.close()
+                conn.send(("quit",))
+                process.join()
+                pygame.quit()
+                sys.exit()
+            elif not ready:
+                continue
+            elif event.type == MOUSEBUTTONUP and event.button == BUTTON_LEFT:
+                if view.collapsed:
+                    if ui.start_over_button.get_rect().collidepoint(event.pos):
+                        ui.start_over_button.handle_click()
+                if ui.pause_button.get_rect().collidepoint(event.pos):
+                    ui.pause_button.handle_click()
+                cell = colony.hive.cell_at(camera.to_world(event.pos))
+                if cell is not None:
+                    view.sync_cell(cell)
+                    click_cell(cell, event.pos)
+                else:
+                    click_waiting_bee(event.pos)
+            elif event.type == MOUSEMOTION and (event.buttons[1] or event.buttons[2]):
+                camera.pan(*event.rel)
+            elif event.type == MOUSEWHEEL:
+                camera.zoom_at(pygame.mouse.get_pos(), event.y)
+            elif event.type == KEYUP:
+                if event.key == K_n:
+                    controls.post(ASSIGN_JOB, NURSE)
+                elif event.key == K_c:
+                    controls.post(ASSIGN_JOB, CLEANER)
+                elif event.key == K_f:
+                    controls.post(ASSIGN_JOB, FOOD_MAKER)
+                elif event.key == K_b:
+                    controls.post(ASSIGN_JOB, BUILDER)
+                elif event.key == K_d:
+                    colony.hive.debug = not colony.hive.debug
+                elif event.key == K_HOME:
+                    camera.reset()
+                elif event.key in [K_1, K_2, K_3]:
+                    set_speed(SPEEDS[[K_1, K_2, K_3].index(event.key)])
+                    conn.send(("speed", colony.hive.speed))
+
+        if ready:
+            if not view.collapsed and not colony.hive.paused:
+                controls.hold(held_keys(pygame.key.get_pressed()))
+            draw_shared_scene(surface, view)
+            view.release()
+            pygame.display.update()
         FramePerSec.tick(FPS)
 
+def print_summary():
+    print("honey %d, bee bread %d, bees %d%s" % (colony.hive.honey, colony.hive.bee_bread, len(colony.hive.bees), ", colony collapsed" if colony.hive.is_collapsed() else ""))
+
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Bee Game", allow_abbrev=False)
+    parser.add_argument("--headless", type=int, metavar="TICKS", help="run the simulation for TICKS ticks without a display")
+    parser.add_argument("--dirty-rects", action="store_true", help="only redraw the parts of the screen that changed (toggle with R)")
+    parser.add_argument("--numpy", action="store_true", help="move bees with the vectorised NumPy backend, if NumPy is installed")
+    parser.add_argument("--seed", type=int, help="seed the hive's random number generator")
+    parser.add_argument("--comb", type=int, default=0, metavar="RADIUS", help="generate a comb about RADIUS cells across from the middle (pan with the right mouse button, zoom with the wheel)")
+    parser.add_argument("--record", metavar="FILE", help="record the player's input to FILE")
+    parser.add_argument("--replay", metavar="FILE", help="replay an input log recorded with --record, without a display")
+    parser.add_argument("--profile", metavar="FILE", help="write per-frame timings to FILE (.json or .csv) on quit (show them with P)")
+    parser.add_argument("--load", metavar="FILE", help="resume the hive saved in snapshot FILE")
+    parser.add_argument("--save", metavar="FILE", help="save a snapshot of the hive to FILE on quit, or after a headless run")
+    parser.add_argument("--telemetry", metavar="FILE", help="stream per-tick colony metrics to FILE (read it with load_telemetry)")
+    parser.add_argument("--split", action="store_true", help="run the simulation in a separate process, so drawing keeps its frame rate however busy the hive is")
+    args = parser.parse_args()
+    if args.split and (args.dirty_rects or args.profile is not None):
+        parser.error("--split cannot be combined with --dirty-rects or --profile")
+    if args.split and (args.headless is not None or args.replay is not None):
+        parser.error("--split cannot be combined with --headless or --replay, which have no display to split from")
+    if args.load is not None and (args.replay is not None or args.record is not None):
+        parser.error("--load cannot be combined with --record or --replay, which start from a seed")
+    try:
+        setup(args.replay, args.headless is not None, args.numpy)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if args.split:
+        main_split(args.seed, args.comb, args.load, args.record, args.save, args.telemetry)
+    if args.load is not None:
+        load_snapshot(args.load)
+    else:
+        init(args.seed, args.comb)
+    if args.telemetry is not None:
+        colony.telemetry = Telemetry(args.telemetry)
+    if args.replay is not None:
+        main_replay(args.replay)
+    elif args.headless is not None:
+        main_headless(args.headless)
+    else:
+        main(args.dirty_rects, args.record, args.profile, args.save)
+    if args.save is not None:
+        save_snapshot(args.save)
+    if colony.telemetry is not None:
+        colony.telemetry.close()
+
@@ -0,0 +1,153 @@
+import os
+import argparse
+import json
+import multiprocessing
+import random
+import time
+import colony
+
+POLICIES = [
+    # name, share of nurses, share of food makers, cells under construction, nursery/bee bread/honey weights
+    ("balanced", 0.5, 0.5, 2, (1, 1, 1)),
+    ("nurses", 0.8, 0.5, 2, (2, 1, 1)),
+    ("cleaners", 0.2, 0.5, 2, (1, 1, 1)),
+    ("food", 0.5, 0.8, 1, (1, 1, 2)),
+    ("builders", 0.5, 0.2, 4, (1, 1, 1)),
+]
+POLICY_INTERVAL = 30
+SAMPLE_INTERVAL = colony.FPS * 10
+CELL_COMMANDS = [colony.MAKE_NURSERY, colony.MAKE_BEE_BREAD, colony.MAKE_HONEY]
+# index of the policy's share for the first of JOB_CHOICES
+JOB_SHARES = {colony.UNASSIGNED: 1, colony.UNASSIGNED2: 2}
+
+
+def collapse_cause(hive):
+    if len(hive.bees) == 0:
+        return "no bees"
+    if hive.honey <= 0:
+        return "honey"
+    if hive.bee_bread <= 0:
+        return "bee bread"
+    return None
+
+def play(hive, policy, rng):
+    name, nurse_share, food_maker_share, builds, weights = policy
+    building = 0
+    unbuilt = []
+    for cell in hive.cells:
+        if cell.state in [colony.BUILD_REQUESTED, colony.BUILDING]:
+            building += 1
+        elif cell.state == colony.UNBUILT:
+            unbuilt.append(cell)
+        elif cell.state == colony.READY:
+            colony.apply_command(rng.choices(CELL_COMMANDS, weights)[0], cell.row, cell.col)
+        elif cell.state == colony.NURSERY:
+            cell.state = colony.NURSERY_WITH_EGG
+            hive.request_nurse(cell)
+    for cell in rng.sample(unbuilt, max(0, min(builds - building, len(unbuilt)))):
+        colony.apply_command(colony.BUILD_CELL, cell.row, cell.col)
+    while len(hive.bees_needing_jobs) > 0:
+        job = hive.bees_needing_jobs.peek().job
+        if job not in JOB_SHARES:
+            break
+        first, second = colony.JOB_CHOICES[job]
+        colony.apply_command(colony.ASSIGN_JOB, first if rng.random() < policy[JOB_SHARES[job]] else second, 0)
+
+def run_colony(run):
+    policy_index, seed, max_ticks = run
+    policy = POLICIES[policy_index]
+    rng = random.Random(seed)
+    colony.init(seed)
+    colony.controls.held = 0
+    hive = colony.hive
+    samples = []
+    while hive.tick < max_ticks and not hive.is_collapsed():
+        play(hive, policy, rng)
+        while len(samples) * SAMPLE_INTERVAL <= hive.tick:
+            samples.append((hive.honey, hive.bee_bread, len(hive.bees)))
+        colony.run_headless(min(POLICY_INTERVAL, max_ticks - hive.tick))
+    return policy_index, seed, hive.tick, collapse_cause(hive), samples
+
+
+class PolicyStats(object):
+    def __init__(self, name):
+        self.name = name
+        self.runs = 0
+        self.survival = []
+        self.causes = {}
+        self.curves = []
+
+    def add(self, ticks, cause, samples):
+        self.runs += 1
+        self.survival.append(ticks)
+        if cause is not None:
+            self.causes[cause] = self.causes.get(cause, 0) + 1
+        for i, sample in enumerate(samples):
+            if i == len(self.curves):
+                self.curves.append([0, 0, 0, 0])
+            totals = self.curves[i]
+            totals[0] += 1
+            for j, value in enumerate(sample):
+                totals[j + 1] += value
+
+    def percentile(self, p):
+        values = sorted(self.survival)
+        return values[min(len(values) - 1, len(values) * p // 100)]
+
+    def collapsed(self):
+        return sum(self.causes.values())
+
+    def summary(self):
+        return {
+            "runs": self.runs,
+            "collapsed": self.collapsed(),
+            "causes": self.causes,
+            "survival_ticks": { "p%d" % p: self.percentile(p) for p in [10, 50, 90] },
+            "mean_survival_ticks": sum(self.survival) / self.runs,
+            "curves": [
+                { "tick": i * SAMPLE_INTERVAL, "alive": n, "honey": honey / n, "bee_bread": bee_bread / n, "bees": bees / n }
+                for i, (n, honey, bee_bread, bees) in enumerate(self.curves)
+            ],
+        }
+
+
+def print_table(stats, done, total, elapsed):
+    print("%d/%d runs in %.1fs" % (done, total, elapsed))
+    print("%-10s %6s %9s %9s %9s %9s  %s" % ("", "runs", "collapsed", "p10", "p50", "p90", "causes"))
+    for policy in stats:
+        if policy.runs == 0:
+            continue
+        causes = ", ".join("%s %d" % item for item in sorted(policy.causes.items()))
+        print("%-10s %6d %8.0f%% %9d %9d %9d  %s" % (
+            policy.name, policy.runs, policy.collapsed() * 100 / policy.runs,
+            policy.percentile(10), policy.percentile(50), policy.percentile(90), causes))
+
+def main():
+    parser = argparse.ArgumentParser(description="Bee Game Monte Carlo colony runs")
+    parser.add_argument("policies", nargs="*", help="policies to run (default: all of %s)" % ", ".join(p[0] for p in POLICIES))
+    parser.add_argument("--runs", type=int, default=1000, help="runs per policy")
+    parser.add_argument("--ticks", type=int, default=colony.FPS * 60 * 20, help="stop a run that survives this many ticks")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first run; later runs count up from it")
+    parser.add_argument("--workers", type=int, default=os.process_cpu_count(), help="worker processes")
+    parser.add_argument("--output", metavar="FILE", help="write survival and resource curves per policy to FILE as JSON")
+    args = parser.parse_args()
+
+    policies = [ i for i, policy in enumerate(POLICIES) if not args.policies or policy[0] in args.policies ]
+    runs = [ (i, args.seed + n, args.ticks) for n in range(args.runs) for i in policies ]
+    stats = [ PolicyStats(policy[0]) for policy in POLICIES ]
+    start = last_report = time.perf_counter()
+    with multiprocessing.Pool(args.workers) as pool:
+        for done, (policy_index, seed, ticks, cause, samples) in enumerate(pool.imap_unordered(run_colony, runs, chunksize=4), 1):
+            stats[policy_index].add(ticks, cause, samples)
+            if time.perf_counter() - last_report > 5:
+                last_report = time.perf_counter()
+                print_table(stats, done, len(runs), last_report - start)
+    print_table(stats, len(runs), len(runs), time.perf_counter() - start)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump({ policy.name: policy.summary() for policy in stats if policy.runs > 0 }, f, indent=2)
+        print("saved results to %s" % args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import os
+import random
+import subprocess
+import sys
+import unittest
+import colony
+
+
+def empty_hive(cols):
+    # one row of cells at known spots and no bees, so tests decide who is idle where
+    colony.hive = colony.Hive(cells = [ colony.Cell(0, col) for col in range(cols) ])
+    return colony.hive
+
+def idle_bee(hive, x, y, job = colony.BUILDER):
+    bee = colony.Bee(x, y, job)
+    hive.add_bee(bee)
+    return bee
+
+def assigned_cell(bee):
+    return bee.tasks[-1].cell if len(bee.tasks) > 0 else None
+
+
+class CollapseTest(unittest.TestCase):
+    def test_honey_below_zero_collapses(self):
+        hive = colony.build_colony(12, 3)
+        hive.honey = 1
+        for bee in list(hive.bees.values())[:3]:
+            hive.cancel(bee.meal_event)
+            bee.meal_event = hive.schedule(1, bee.eat)
+        colony.update()
+        self.assertEqual(hive.honey, -2)
+        self.assertTrue(hive.is_collapsed())
+        self.assertEqual(colony.run_headless(100), 0)
+
+
+class WorkQueueTest(unittest.TestCase):
+    def test_keeps_push_order(self):
+        queue = colony.WorkQueue()
+        for item in "abcdab":
+            queue.push(item)
+        queue.cancel("b")
+        queue.cancel("z")
+        self.assertEqual(queue.first(2), ["a", "c"])
+        self.assertEqual(queue.pop(), "a")
+        queue.push("a")
+        self.assertEqual(list(queue), ["c", "d", "a"])
+        self.assertEqual([queue.pop(), queue.pop(), queue.pop(), queue.pop()], ["c", "d", "a", None])
+        self.assertIsNone(queue.peek())
+
+
+class DispatchTest(unittest.TestCase):
+    def test_closest_pair_goes_first(self):
+        hive = empty_hive(2)
+        a, b = hive.get_cell(0, 0), hive.get_cell(0, 1)
+        ax, y = a.rect.center
+        bx = b.rect.center[0]
+        # the first cell in the queue would take near_both, but b and near_both are the closest pair
+        near_both = idle_bee(hive, bx - (bx - ax) * 0.4, y)
+        far = idle_bee(hive, ax - 100, y)
+        hive.request_builder(a)
+        hive.request_builder(b)
+        hive.dispatch()
+        self.assertIs(assigned_cell(near_both), b)
+        self.assertIs(assigned_cell(far), a)
+        self.assertEqual(len(hive.cells_needing_builder), 0)
+
+    def test_ties_go_to_the_lower_id(self):
+        hive = empty_hive(1)
+        x, y = hive.get_cell(0, 0).rect.center
+        low = idle_bee(hive, x - 50, y)
+        high = idle_bee(hive, x + 50, y)
+        # pooled last, so only its id puts it first
+        hive.unpool_bee(low)
+        hive.pool_bee(low)
+        hive.request_builder(hive.get_cell(0, 0))
+        hive.dispatch()
+        self.assertIs(assigned_cell(low), hive.get_cell(0, 0))
+        self.assertIsNone(assigned_cell(high))
+
+    def test_cells_wait_for_bees(self):
+        hive = empty_hive(3)
+        bee = idle_bee(hive, 0, 0)
+        for col in range(3):
+            hive.request_builder(hive.get_cell(0, col))
+        hive.dispatch()
+        self.assertIs(assigned_cell(bee), hive.get_cell(0, 0))
+        self.assertEqual(list(hive.cells_needing_builder), [hive.get_cell(0, 1), hive.get_cell(0, 2)])
+
+    def test_request_job_takes_the_nearest_cell_in_the_window(self):
+        hive = empty_hive(colony.DISPATCH_WINDOW + 2)
+        cells = [ hive.get_cell(0, col) for col in range(colony.DISPATCH_WINDOW + 2) ]
+        # the last cell is the closest, but sits outside the window of the oldest cells
+        bee = idle_bee(hive, *cells[-1].rect.center, job = colony.CLEANER)
+        bee.set_idle(False)
+        for cell in cells:
+            hive.cells_needing_cleaner.push(cell)
+        hive.request_job(bee)
+        window = cells[colony.DISPATCH_WINDOW - 1]
+        self.assertIs(assigned_cell(bee), window)
+        self.assertEqual(list(hive.cells_needing_cleaner), [ cell for cell in cells if cell is not window ])
+
+
+class SpatialHashTest(unittest.TestCase):
+    def test_nearest_matches_a_full_scan(self):
+        rng = random.Random(2)
+        grid = colony.SpatialHash(50)
+        points = {}
+        self.assertIsNone(grid.nearest((0, 0), points.get))
+        for id in range(400):
+            if id % 10 == 0 and id > 0:
+                # some items share a spot, so ties are decided by id
+                point = points[rng.randrange(id)]
+            else:
+                point = (rng.uniform(-1000, 1000), rng.uniform(-600, 600))
+            points[id] = point
+            grid.move(id, id, point)
+        for id in rng.sample(sorted(points), 100):
+            grid.remove(id)
+            del points[id]
+        for i in range(300):
+            query = (rng.uniform(-1500, 1500), rng.uniform(-900, 900))
+            expected = min((colony.distance(query, point), id) for id, point in points.items())
+            self.assertEqual(grid.nearest(query, points.get)[:2], expected)
+
+
+class ImportTest(unittest.TestCase):
+    def test_simulation_imports_alone(self):
+        # the tests and Monte Carlo runs import it without a display or the drawing code
+        code = "import sys, colony; print([ m for m in ('pygame', 'multiprocessing', 'csv', 'json') if m in sys.modules ])"
+        here = os.path.dirname(os.path.abspath(__file__))
+        output = subprocess.run([sys.executable, "-c", code], cwd=here, capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), "[]")
+
+    def test_game_leaves_the_command_line_alone(self):
+        # only running main.py reads its flags, so importing it under another program's flags changes nothing
+        code = ("import sys; sys.argv[1:] = ['--replay', '/nonexistent', '--headless', 'x', '--numpy']; import colony, main; "
+                "print(colony.SCREEN_WIDTH, colony.SCREEN_HEIGHT, colony.USE_NUMPY, main.pygame.display.get_init())")
+        here = os.path.dirname(os.path.abspath(__file__))
+        env = dict(os.environ, PYGAME_HIDE_SUPPORT_PROMPT="1")
+        env.pop("BEE_SCREEN", None)
+        env.pop("BEE_NUMPY", None)
+        output = subprocess.run([sys.executable, "-c", code], cwd=here, env=env, capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), "1920 1080 False False")
+
+
+if __name__ == "__main__":
+    unittest.main()
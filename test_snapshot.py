@@ -0,0 +1,67 @@
+import unittest
+import colony
+
+
+def run_ticks(hive, ticks):
+    for i in range(ticks):
+        if hive.tick % 30 == 0:
+            colony.tend_colony(hive, hive.tick // 30)
+        colony.update()
+
+def grow_hive(bees, radius, seed):
+    # a busy colony with the queen on the move, so snapshots hold tasks, queues, travellers and events
+    hive = colony.build_colony(bees, radius, seed)
+    colony.qb.center = (colony.SCREEN_WIDTH - 200, 200)
+    colony.controls.held = colony.QB_LEFT | colony.QB_DOWN | colony.QB_LAY
+    run_ticks(hive, 700)
+    return hive
+
+
+class SnapshotTest(unittest.TestCase):
+    def check_round_trip(self, bees, radius):
+        hive = grow_hive(bees, radius, 3)
+        data = colony.dump_hive(hive)
+        queen = colony.qb.center
+        loaded = colony.load_hive(data)
+        self.assertEqual(colony.dump_hive(loaded), data)
+        self.assertEqual(colony.qb.center, queen)
+
+        colony.hive = hive
+        run_ticks(hive, 900)
+        expected = colony.dump_hive(hive)
+        colony.hive = loaded
+        colony.qb.center = queen
+        run_ticks(loaded, 900)
+        self.assertEqual(colony.dump_hive(loaded), expected)
+
+    def test_small_colony(self):
+        self.check_round_trip(20, 4)
+
+    def test_large_colony(self):
+        self.check_round_trip(300, 12)
+
+    def test_saving_leaves_the_run_alone(self):
+        hive = grow_hive(100, 8, 5)
+        queen = colony.qb.center
+        loaded = colony.load_hive(colony.dump_hive(hive))
+        colony.hive = hive
+        for i in range(6):
+            run_ticks(hive, 100)
+            colony.dump_hive(hive)
+        expected = colony.dump_hive(hive)
+        colony.hive = loaded
+        colony.qb.center = queen
+        run_ticks(loaded, 600)
+        self.assertEqual(colony.dump_hive(loaded), expected)
+
+    def test_rejects_other_screen_size(self):
+        data = bytearray(colony.dump_hive(grow_hive(4, 3, 1)))
+        header = list(colony.SNAPSHOT_HEADER.unpack_from(data))
+        header[2:4] = [2560, 1440]
+        colony.SNAPSHOT_HEADER.pack_into(data, 0, *header)
+        with self.assertRaises(ValueError):
+            colony.load_hive(bytes(data))
+
+
+if __name__ == "__main__":
+    unittest.main()